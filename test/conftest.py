@@ -0,0 +1,20 @@
+import pytest
+
+from worktree_docker.worktree_docker import clear_cache_dir_memo
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache_dir_lookup():
+    """Forget .wtd lookups memoized by earlier tests, which may have created or removed them."""
+    clear_cache_dir_memo()
+    yield
+    clear_cache_dir_memo()
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--wtd-cache",
+        action="store_true",
+        default=False,
+        help="Reuse stored workflow script results while the script and wtd sources are unchanged",
+    )
@@ -2,10 +2,18 @@
 Comprehensive test suite for the new wtd implementation with Docker Compose + Buildx/Bake
 """
 
+import os
+import re
+import subprocess
+import sys
+import time
 import pytest
 import tempfile
+import yaml
 from pathlib import Path
+from types import SimpleNamespace
 from unittest.mock import Mock, patch
+from worktree_docker.extension_test_runner import run_streaming
 from worktree_docker.worktree_docker import (
     RepoSpec,
     Extension,
@@ -19,15 +27,19 @@ from worktree_docker.worktree_docker import (
     get_worktree_dir,
     setup_bare_repo,
     setup_worktree,
+    get_available_branches,
     ensure_buildx_builder,
     generate_dockerfile,
     generate_compose_file,
     generate_bake_file,
+    write_if_changed,
     should_rebuild_image,
+    _docker_state,
     build_image_with_bake,
     run_compose_service,
     list_active_containers,
     destroy_environment,
+    prune_all,
     launch_environment,
     cmd_launch,
     cmd_list,
@@ -35,6 +47,33 @@ from worktree_docker.worktree_docker import (
     cmd_ext,
     cmd_doctor,
     main,
+    resolve_extension_dependencies,
+)
+
+WTD = "worktree_docker.worktree_docker"
+
+# Shared subprocess results; tests only read these, so one instance each is enough
+_OK = Mock(returncode=0, stdout="", stderr="")
+_FAIL = Mock(returncode=1, stdout="", stderr="")
+
+
+@pytest.fixture
+def fake_ids(monkeypatch):
+    """Pin the host uid/gid passed through to compose."""
+    monkeypatch.setattr(os, "getuid", lambda: 1000)
+    monkeypatch.setattr(os, "getgid", lambda: 1000)
+
+
+# Shared extensions for the file generation tests
+_EXT_BASE = Extension("base", "FROM ubuntu:22.04\nRUN apt-get update", {})
+_EXT_GIT = Extension("git", "RUN apt-get install -y git", {})
+_EXT_X11 = Extension(
+    "x11",
+    "",
+    {
+        "environment": {"DISPLAY": "${DISPLAY}"},
+        "volumes": ["/tmp/.X11-unix:/tmp/.X11-unix:rw"],
+    },
 )
 
 
@@ -109,6 +148,31 @@ class TestExtension:
 
         assert ext1.hash != ext2.hash
 
+    def test_extension_hash_changes_with_files(self):
+        """Test that hash covers auxiliary file names and contents."""
+        ext1 = Extension("test", "FROM ubuntu", {}, files={"a.sh": "echo a"})
+        ext2 = Extension("test", "FROM ubuntu", {}, files={"a.sh": "echo b"})
+        ext3 = Extension("test", "FROM ubuntu", {}, files={"b.sh": "echo a"})
+
+        assert len({ext1.hash, ext2.hash, ext3.hash}) == 3
+
+    def test_resolve_orders_by_stability_rank(self):
+        """Test stable extensions are layered first, after their dependencies."""
+        exts = {
+            "base": Extension("base", "", {}, manifest={"stability_rank": 0}),
+            "user": Extension("user", "", {}, manifest={"stability_rank": 55}),
+            "pixi": Extension(
+                "pixi", "", {}, manifest={"stability_rank": 60, "dependencies": ["user"]}
+            ),
+            "uv": Extension("uv", "", {}),
+        }
+        manager = Mock()
+        manager.get_extension.side_effect = exts.get
+
+        for requested in (["pixi", "uv", "base"], ["base", "uv", "pixi"]):
+            resolved = resolve_extension_dependencies(list(requested), manager)
+            assert resolved == ["base", "uv", "user", "pixi"]
+
 
 class TestRenvConfig:
     """Test RenvConfig functionality."""
@@ -124,8 +188,6 @@ class TestRenvConfig:
             }
 
             with open(config_path, "w", encoding="utf-8") as f:
-                import yaml
-
                 yaml.dump(config_data, f)
 
             config = RenvConfig(Path(tmpdir))
@@ -207,28 +269,83 @@ class TestExtensionManager:
             assert "git" in extensions
             assert "user" in extensions
 
+    def test_list_extensions_with_local(self, tmp_path):
+        """Test that repo-local extensions are merged in sorted order without duplicates."""
+        for name in ("git", "aaa-custom"):
+            (tmp_path / "repo" / ".wtd" / "exts" / name).mkdir(parents=True)
+
+        extensions = ExtensionManager(tmp_path).list_extensions(tmp_path / "repo")
+        assert extensions == sorted(set(extensions))
+        assert "aaa-custom" in extensions
+        assert extensions.count("git") == 1
+
+    def test_builtin_extensions_cached(self, tmp_path):
+        """Test that a second manager reuses the built-in extensions loaded by the first."""
+        first = ExtensionManager(tmp_path)
+        with patch.object(ExtensionManager, "_load_extension_from_dir") as mock_load:
+            second = ExtensionManager(tmp_path)
+        mock_load.assert_not_called()
+        # Equal content, but each manager owns its copy
+        assert second.get_extension("base") == first.get_extension("base")
+        assert second.get_extension("base") is not first.get_extension("base")
+
+    def test_builtin_extensions_reloaded_on_edit(self, tmp_path):
+        """Test that editing a file inside one extension rereads only that extension."""
+        # pylint: disable=protected-access
+        manager = ExtensionManager(tmp_path / "cache")
+        manager.global_extensions_dir = tmp_path / "extensions"
+        for name in ("alpha", "beta"):
+            (manager.global_extensions_dir / name).mkdir(parents=True)
+            (manager.global_extensions_dir / name / "Dockerfile").write_text(f"RUN echo {name}")
+        assert manager._load_builtin_extensions()["alpha"].dockerfile_content == "RUN echo alpha"
+
+        dockerfile = manager.global_extensions_dir / "alpha" / "Dockerfile"
+        dockerfile.write_text("RUN echo edited")
+        os.utime(dockerfile, ns=(0, 0))
+        with patch.object(
+            ExtensionManager,
+            "_load_extension_from_dir",
+            autospec=True,
+            side_effect=ExtensionManager._load_extension_from_dir,
+        ) as mock_load:
+            extensions = manager._load_builtin_extensions()
+        assert extensions["alpha"].dockerfile_content == "RUN echo edited"
+        assert [call.args[1] for call in mock_load.call_args_list] == ["alpha"]
+
 
 class TestPathHelpers:
     """Test path helper functions."""
 
-    @patch.dict("os.environ", {"WTD_CACHE_DIR": "/custom/cache"})
-    def test_get_cache_dir_custom(self):
+    def test_get_cache_dir_custom(self, monkeypatch):
         """Test custom cache directory from environment."""
-        assert get_cache_dir() == Path("/custom/cache")
+        monkeypatch.setenv("WTD_CACHE_DIR", "/custom/cache")
+        assert str(get_cache_dir()) == "/custom/cache"
 
-    @patch.dict("os.environ", {}, clear=True)
-    def test_get_cache_dir_default(self):
+    def test_get_cache_dir_default(self, monkeypatch):
         """Test default cache directory falls back to home if no .wtd found upward."""
-        with patch("worktree_docker.worktree_docker.Path.cwd") as mock_cwd:
+        monkeypatch.delenv("WTD_CACHE_DIR", raising=False)
+        with patch(f"{WTD}.Path.cwd") as mock_cwd:
             # Mock current directory with no .wtd directory upward
             mock_cwd.return_value = Path("/no/wtd/here")
             with patch("pathlib.Path.exists", return_value=False):
                 assert get_cache_dir() == Path.home() / ".wtd"
 
-    @patch.dict("os.environ", {}, clear=True)
-    def test_get_cache_dir_upward_search(self):
+    def test_get_cache_dir_rechecked_per_main_call(self, monkeypatch, tmp_path):
+        """Test a .wtd directory created after a lookup is found by the next main() call."""
+        monkeypatch.delenv("WTD_CACHE_DIR", raising=False)
+        monkeypatch.chdir(tmp_path)
+        assert get_cache_dir() != tmp_path / ".wtd"
+        (tmp_path / ".wtd").mkdir()
+
+        seen = []
+        with patch(f"{WTD}.cmd_list", side_effect=lambda _args: seen.append(get_cache_dir()) or 0):
+            assert main(["--list"]) == 0
+        assert seen == [tmp_path / ".wtd"]
+
+    def test_get_cache_dir_upward_search(self, monkeypatch):
         """Test upward search for .wtd directory."""
-        with patch("worktree_docker.worktree_docker.Path.cwd") as mock_cwd:
+        monkeypatch.delenv("WTD_CACHE_DIR", raising=False)
+        with patch(f"{WTD}.Path.cwd") as mock_cwd:
             mock_cwd.return_value = Path("/project/subdir/deep")
 
             def mock_exists(self):
@@ -240,37 +357,34 @@ class TestPathHelpers:
 
             with patch.object(Path, "exists", mock_exists):
                 with patch.object(Path, "is_dir", mock_is_dir):
-                    assert get_cache_dir() == Path("/project/.wtd")
+                    assert str(get_cache_dir()) == "/project/.wtd"
 
     def test_get_workspaces_dir(self):
         """Test workspaces directory."""
-        with patch("worktree_docker.worktree_docker.get_cache_dir", return_value=Path("/cache")):
-            assert get_workspaces_dir() == Path("/cache/workspaces")
+        with patch(f"{WTD}.get_cache_dir", return_value=Path("/cache")):
+            assert str(get_workspaces_dir()) == "/cache/workspaces"
 
     def test_get_repo_dir(self):
         """Test repository directory path."""
         spec = RepoSpec("owner", "repo", "main")
-        with patch(
-            "worktree_docker.worktree_docker.get_workspaces_dir", return_value=Path("/workspaces")
-        ):
-            assert get_repo_dir(spec) == Path("/workspaces/owner/repo")
+        with patch(f"{WTD}.get_workspaces_dir", return_value=Path("/workspaces")):
+            assert str(get_repo_dir(spec)) == "/workspaces/owner/repo"
 
     def test_get_worktree_dir(self):
         """Test worktree directory path."""
         spec = RepoSpec("owner", "repo", "feature/new")
-        with patch("worktree_docker.worktree_docker.get_repo_dir", return_value=Path("/repo")):
-            assert get_worktree_dir(spec) == Path("/repo/worktree-feature-new")
+        with patch(f"{WTD}.get_repo_dir", return_value=Path("/repo")):
+            assert str(get_worktree_dir(spec)) == "/repo/worktree-feature-new"
 
 
 class TestGitOperations:
     """Test Git operations."""
 
     @patch("subprocess.run")
-    @patch("pathlib.Path.exists")
-    def test_setup_bare_repo_clone(self, mock_exists, mock_run):
+    def test_setup_bare_repo_clone(self, mock_run, monkeypatch, tmp_path):
         """Test cloning a new bare repository."""
-        mock_exists.return_value = False
-        mock_run.return_value = Mock(returncode=0)
+        monkeypatch.setattr(f"{WTD}.get_repo_dir", lambda _spec: tmp_path / "repo")
+        mock_run.return_value = _OK
 
         spec = RepoSpec("owner", "repo", "main")
         setup_bare_repo(spec)
@@ -281,14 +395,26 @@ class TestGitOperations:
         assert "git" in call_args
         assert "clone" in call_args
         assert "--bare" in call_args
+        assert "--filter=blob:none" in call_args
         assert "git@github.com:owner/repo.git" in call_args
 
     @patch("subprocess.run")
-    @patch("pathlib.Path.exists")
-    def test_setup_bare_repo_fetch(self, mock_exists, mock_run):
+    def test_setup_bare_repo_full_clone(self, mock_run, monkeypatch, tmp_path):
+        """Test an empty WTD_CLONE_FILTER asks for a full clone."""
+        monkeypatch.setattr(f"{WTD}.get_repo_dir", lambda _spec: tmp_path / "repo")
+        monkeypatch.setenv("WTD_CLONE_FILTER", "")
+        mock_run.return_value = _OK
+
+        setup_bare_repo(RepoSpec("owner", "repo", "main"))
+
+        call_args = mock_run.call_args[0][0]
+        assert not any(arg.startswith("--filter") for arg in call_args)
+
+    @patch("subprocess.run")
+    def test_setup_bare_repo_fetch(self, mock_run, monkeypatch, tmp_path):
         """Test fetching updates for existing bare repository."""
-        mock_exists.return_value = True
-        mock_run.return_value = Mock(returncode=0)
+        monkeypatch.setattr(f"{WTD}.get_repo_dir", lambda _spec: tmp_path)
+        mock_run.return_value = _OK
 
         spec = RepoSpec("owner", "repo", "main")
         setup_bare_repo(spec)
@@ -300,13 +426,20 @@ class TestGitOperations:
         assert "fetch" in call_args
         assert "--all" in call_args
 
-    @patch("worktree_docker.worktree_docker.setup_bare_repo")
+    @patch(f"{WTD}.setup_bare_repo")
     @patch("subprocess.run")
-    @patch("pathlib.Path.exists")
-    def test_setup_worktree_create(self, mock_exists, mock_run, mock_setup_bare):
+    def test_setup_worktree_create(self, mock_run, mock_setup_bare, monkeypatch, tmp_path):
         """Test creating a new worktree."""
-        mock_exists.return_value = False
-        mock_run.return_value = Mock(returncode=0)
+        monkeypatch.setattr(f"{WTD}.get_repo_dir", lambda _spec: tmp_path)
+        monkeypatch.setattr(f"{WTD}.get_worktree_dir", lambda _spec: tmp_path / "worktree-feature")
+
+        def fake_worktree_add(*_args, **_kwargs):
+            # Like git, leave the worktree's .git file behind
+            (tmp_path / "worktree-feature").mkdir(exist_ok=True)
+            (tmp_path / "worktree-feature" / ".git").touch()
+            return _OK
+
+        mock_run.side_effect = fake_worktree_add
 
         spec = RepoSpec("owner", "repo", "feature")
         setup_worktree(spec)
@@ -321,6 +454,50 @@ class TestGitOperations:
         assert "worktree" in call_args
         assert "add" in call_args
 
+    @pytest.mark.parametrize("refs", [None, "loose", "packed"])
+    @patch(f"{WTD}.setup_bare_repo")
+    @patch("subprocess.run")
+    def test_setup_worktree_single_add(self, mock_run, _mock_setup_bare, refs, tmp_path):
+        """Test the worktree is added with one git call, picked from the local refs."""
+        worktree_dir = tmp_path / "worktree-feature-x"
+        if refs == "loose":
+            (tmp_path / "refs/heads/feature").mkdir(parents=True)
+            (tmp_path / "refs/heads/feature/x").write_text("0" * 40 + "\n", encoding="utf-8")
+        elif refs == "packed":
+            (tmp_path / "packed-refs").write_text(
+                f"# pack-refs with: peeled\n{'0' * 40} refs/heads/feature/x\n", encoding="utf-8"
+            )
+
+        def fake_worktree_add(*_args, **_kwargs):
+            worktree_dir.mkdir()
+            (worktree_dir / ".git").touch()
+            return _OK
+
+        mock_run.side_effect = fake_worktree_add
+        with (
+            patch(f"{WTD}.get_repo_dir", return_value=tmp_path),
+            patch(f"{WTD}.get_worktree_dir", return_value=worktree_dir),
+        ):
+            setup_worktree(RepoSpec("owner", "repo", "feature/x"))
+
+        mock_run.assert_called_once()
+        assert ("-b" in mock_run.call_args[0][0]) is (refs is None)
+
+    def test_available_branches_from_refs(self, monkeypatch, tmp_path):
+        """Test worktree directory names are mapped back to branches through the refs."""
+        monkeypatch.setattr(f"{WTD}.get_repo_dir", lambda _spec: tmp_path)
+        (tmp_path / "refs/heads/feature").mkdir(parents=True)
+        (tmp_path / "refs/heads/feature/login").touch()
+        (tmp_path / "refs/heads/fix-typo").touch()
+        (tmp_path / "packed-refs").write_text(f"{'0' * 40} refs/heads/main\n", encoding="utf-8")
+        for name in ("worktree-feature-login", "worktree-fix-typo", "worktree-release-v1"):
+            (tmp_path / name).mkdir()
+
+        branches = get_available_branches(RepoSpec("owner", "repo"))
+
+        # release-v1 has no ref, so only it falls back to the hyphen heuristic
+        assert branches == ["feature/login", "fix-typo", "main", "release/v1"]
+
 
 class TestBuildxOperations:
     """Test Docker Buildx operations."""
@@ -330,8 +507,8 @@ class TestBuildxOperations:
         """Test creating a new Buildx builder."""
         # First call (inspect) fails, second call (create) succeeds
         mock_run.side_effect = [
-            Mock(returncode=1),  # inspect fails
-            Mock(returncode=0),  # create succeeds
+            _FAIL,  # inspect fails
+            _OK,  # create succeeds
         ]
 
         result = ensure_buildx_builder("test_builder")
@@ -348,11 +525,9 @@ class TestBuildxOperations:
     @patch("subprocess.run")
     def test_ensure_buildx_builder_create_failure(self, mock_run):
         """Test builder creation failure returns False and logs error."""
-        import subprocess
-
         # First call (inspect) fails, second call (create) raises error
         mock_run.side_effect = [
-            Mock(returncode=1),  # inspect fails
+            _FAIL,  # inspect fails
             subprocess.CalledProcessError(
                 1, ["docker", "buildx", "create", "test_builder"]
             ),  # create fails
@@ -367,7 +542,7 @@ class TestBuildxOperations:
     @patch("subprocess.run")
     def test_ensure_buildx_builder_exists(self, mock_run):
         """Test using existing Buildx builder."""
-        mock_run.return_value = Mock(returncode=0)
+        mock_run.return_value = _OK
 
         result = ensure_buildx_builder("test_builder")
         assert result is True
@@ -388,12 +563,7 @@ class TestFileGeneration:
         with tempfile.TemporaryDirectory() as tmpdir:
             work_dir = Path(tmpdir)
 
-            extensions = [
-                Extension("base", "FROM ubuntu:22.04\nRUN apt-get update", {}),
-                Extension("git", "RUN apt-get install -y git", {}),
-            ]
-
-            content = generate_dockerfile(extensions, "ubuntu:22.04", work_dir)
+            content = generate_dockerfile([_EXT_BASE, _EXT_GIT], "ubuntu:22.04", work_dir)
 
             assert "FROM ubuntu:22.04 as base" in content
             assert "Extension: base" in content
@@ -414,21 +584,9 @@ class TestFileGeneration:
             repo_dir = Path(tmpdir) / "repo.git"
 
             spec = RepoSpec("owner", "repo", "main", "src")
-            extensions = [
-                Extension("base", "", {}),
-                Extension(
-                    "x11",
-                    "",
-                    {
-                        "environment": {"DISPLAY": "${DISPLAY}"},
-                        "volumes": ["/tmp/.X11-unix:/tmp/.X11-unix:rw"],
-                    },
-                ),
-            ]
-
             compose_config_obj = ComposeConfig(
                 repo_spec=spec,
-                extensions=extensions,
+                extensions=[_EXT_BASE, _EXT_X11],
                 image_name="test:image",
                 work_dir=work_dir,
                 worktree_dir=worktree_dir,
@@ -446,31 +604,37 @@ class TestFileGeneration:
             assert "/tmp/.X11-unix:/tmp/.X11-unix:rw" in service["volumes"]
             # Should have 4 volumes: worktree, repo.git, worktree git metadata, and x11
             assert (
-                len(
-                    [
-                        v
-                        for v in service["volumes"]
-                        if "worktree" in v or "repo.git" in v or "X11" in v
-                    ]
+                sum(
+                    ("worktree" in v) or ("repo.git" in v) or ("X11" in v)
+                    for v in service["volumes"]
                 )
                 >= 4
             )
 
-            # Check file was written
+            # Check file was written, as JSON that any YAML parser also accepts
             compose_file = work_dir / "docker-compose.yml"
             assert compose_file.exists()
+            assert yaml.safe_load(compose_file.read_text(encoding="utf-8")) == compose_config
+
+    def test_write_if_changed(self, tmp_path):
+        """Test that identical content leaves the existing file untouched."""
+        path = tmp_path / "Dockerfile"
+        assert write_if_changed(path, "FROM ubuntu") is True
+        mtime = path.stat().st_mtime_ns
+
+        assert write_if_changed(path, "FROM ubuntu") is False
+        assert path.stat().st_mtime_ns == mtime
+        assert write_if_changed(path, "FROM debian") is True
+        assert path.read_text(encoding="utf-8") == "FROM debian"
 
     def test_generate_bake_file(self):
         """Test docker-bake.hcl generation."""
         with tempfile.TemporaryDirectory() as tmpdir:
             work_dir = Path(tmpdir)
 
-            extensions = [
-                Extension("base", "FROM ubuntu", {}),
-                Extension("git", "RUN apt-get install git", {}),
-            ]
-
-            content = generate_bake_file(extensions, "ubuntu:22.04", ["linux/amd64"], work_dir)
+            content = generate_bake_file(
+                [_EXT_BASE, _EXT_GIT], "ubuntu:22.04", ["linux/amd64"], work_dir
+            )
 
             assert 'target "ext-base"' in content
             assert 'target "ext-git"' in content
@@ -485,6 +649,27 @@ class TestFileGeneration:
             bake_file = work_dir / "docker-bake.hcl"
             assert bake_file.exists()
 
+    def test_generate_bake_file_cache_dir_override(self, monkeypatch, tmp_path):
+        """Test WTD_BUILDX_CACHE redirects the bake layer cache."""
+        monkeypatch.setenv("WTD_BUILDX_CACHE", "/var/cache/wtd-buildx")
+
+        content = generate_bake_file([_EXT_BASE], "ubuntu:22.04", ["linux/amd64"], tmp_path)
+
+        assert "type=local,src=/var/cache/wtd-buildx" in content
+        assert "type=local,dest=/var/cache/wtd-buildx,mode=max" in content
+        assert ".buildx-cache" not in content
+
+    def test_generate_bake_file_cache_registry(self, monkeypatch, tmp_path):
+        """Test WTD_CACHE_REGISTRY adds a registry cache next to the local one."""
+        monkeypatch.setenv("WTD_CACHE_REGISTRY", "ghcr.io/owner/")
+
+        content = generate_bake_file([_EXT_BASE], "ubuntu:22.04", ["linux/amd64"], tmp_path)
+
+        assert "type=local,src=.buildx-cache" in content
+        assert '"type=registry,ref=ghcr.io/owner/base:buildcache"' in content
+        assert '"type=registry,ref=ghcr.io/owner/base:buildcache,mode=max"' in content
+        assert "type=registry,ref=ghcr.io/owner/final:" in content
+
 
 class TestDockerOperations:
     """Test Docker operations."""
@@ -492,7 +677,7 @@ class TestDockerOperations:
     @patch("subprocess.run")
     def test_should_rebuild_image_not_exists(self, mock_run):
         """Test rebuild when image doesn't exist."""
-        mock_run.return_value = Mock(returncode=1)  # Image doesn't exist
+        mock_run.return_value = _FAIL  # Image doesn't exist
 
         result = should_rebuild_image("test:image", [])
         assert result is True
@@ -500,15 +685,37 @@ class TestDockerOperations:
     @patch("subprocess.run")
     def test_should_rebuild_image_exists(self, mock_run):
         """Test no rebuild when image exists."""
-        mock_run.return_value = Mock(returncode=0)  # Image exists
+        mock_run.return_value = _OK  # Image exists
 
         result = should_rebuild_image("test:image", [])
         assert result is False
 
+    @patch("subprocess.run")
+    def test_docker_state_single_inspect(self, mock_run):
+        """Test that one inspect call reports both the container status and the image."""
+        mock_run.return_value = Mock(
+            returncode=0, stdout=b'{"State": {"Status": "exited"}}\n{"RepoTags": ["wtd/r:1"]}\n'
+        )
+
+        state = _docker_state("r-main", "wtd/r:1")
+        assert state == ("exited", True)
+        assert mock_run.call_count == 1
+        assert should_rebuild_image("wtd/r:1", [], state) is False
+        assert should_rebuild_image("wtd/r:1", [], (None, False)) is True
+
+    @patch("subprocess.run")
+    def test_docker_state_ignores_other_objects(self, mock_run):
+        """Test that a volume or network sharing a name is not taken for the image."""
+        mock_run.return_value = Mock(
+            returncode=1, stdout=b'{"Name": "r-main", "Driver": "local", "Mountpoint": "/v"}\n'
+        )
+
+        assert _docker_state("r-main", "wtd/r:1") == (None, False)
+
     @patch("subprocess.run")
     def test_build_image_with_bake_success(self, mock_run):
         """Test successful image build with bake."""
-        mock_run.return_value = Mock(returncode=0)
+        mock_run.return_value = _OK
 
         with tempfile.TemporaryDirectory() as tmpdir:
             result = build_image_with_bake(Path(tmpdir), "test_builder")
@@ -536,15 +743,14 @@ class TestDockerOperations:
         assert containers[0]["image"] == "test:latest"
 
 
+@pytest.mark.usefixtures("fake_ids")
 class TestComposeOperations:
     """Test Docker Compose operations."""
 
     @patch("subprocess.run")
-    @patch("os.getuid", return_value=1000)
-    @patch("os.getgid", return_value=1000)
-    def test_run_compose_service_interactive(self, mock_getgid, mock_getuid, mock_run):  # pylint: disable=unused-argument
+    def test_run_compose_service_interactive(self, mock_run):
         """Test running compose service interactively."""
-        mock_run.return_value = Mock(returncode=0)
+        mock_run.return_value = _OK
 
         with tempfile.TemporaryDirectory() as tmpdir:
             spec = RepoSpec("owner", "repo", "main")
@@ -554,43 +760,35 @@ class TestComposeOperations:
             # Now includes: inspect + stop + rm + up + git fix + exec = 6 calls
             assert mock_run.call_count >= 4  # At least up + git fix + exec + cleanup calls
 
-            # Find the compose up call (should be after cleanup calls)
-            up_calls = [
-                call
-                for call in mock_run.call_args_list
-                if len(call[0]) > 0 and "compose" in call[0][0] and "up" in call[0][0]
-            ]
+            # Categorize compose up, git fix and interactive exec calls in a single pass
+            up_calls, git_fix_calls, exec_calls = [], [], []
+            for call in mock_run.call_args_list:
+                if not call[0]:
+                    continue
+                cmd = call[0][0]
+                if "compose" in cmd and "up" in cmd:
+                    up_calls.append(cmd)
+                elif "exec" in cmd and "-T" in cmd:
+                    git_fix_calls.append(cmd)
+                elif "exec" in cmd and "bash" in cmd:
+                    exec_calls.append(cmd)
+
             assert len(up_calls) == 1
-            up_call = up_calls[0][0][0]
+            up_call = up_calls[0]
             assert "docker" in up_call
             assert "compose" in up_call
             assert "up" in up_call
             assert "-d" in up_call
 
-            # Find the git fix call
-            git_fix_calls = [
-                call
-                for call in mock_run.call_args_list
-                if len(call[0]) > 0 and "exec" in call[0][0] and "-T" in call[0][0]
-            ]
             assert len(git_fix_calls) == 1
-            git_fix_call = git_fix_calls[0][0][0]
+            git_fix_call = git_fix_calls[0]
             assert "docker" in git_fix_call
             assert "compose" in git_fix_call
             assert "exec" in git_fix_call
             assert "-T" in git_fix_call
 
-            # Find the interactive exec call
-            exec_calls = [
-                call
-                for call in mock_run.call_args_list
-                if len(call[0]) > 0
-                and "exec" in call[0][0]
-                and "bash" in call[0][0]
-                and "-T" not in call[0][0]
-            ]
             assert len(exec_calls) == 1
-            exec_call = exec_calls[0][0][0]
+            exec_call = exec_calls[0]
             assert "docker" in exec_call
             assert "compose" in exec_call
             assert "exec" in exec_call
@@ -598,11 +796,9 @@ class TestComposeOperations:
             assert "bash" in exec_call
 
     @patch("subprocess.run")
-    @patch("os.getuid", return_value=1000)
-    @patch("os.getgid", return_value=1000)
-    def test_run_compose_service_with_command(self, mock_getgid, mock_getuid, mock_run):  # pylint: disable=unused-argument
+    def test_run_compose_service_with_command(self, mock_run):
         """Test running compose service with command."""
-        mock_run.return_value = Mock(returncode=0)
+        mock_run.return_value = _OK
 
         with tempfile.TemporaryDirectory() as tmpdir:
             spec = RepoSpec("owner", "repo", "main")
@@ -624,16 +820,14 @@ class TestComposeOperations:
     @patch("subprocess.run")
     def test_destroy_environment(self, mock_run):
         """Test destroying an environment."""
-        mock_run.return_value = Mock(returncode=0)
+        mock_run.return_value = _OK
 
         with tempfile.TemporaryDirectory() as tmpdir:
             # Create build cache directory
             build_dir = Path(tmpdir) / "build-cache"
             build_dir.mkdir()
 
-            with patch(
-                "worktree_docker.worktree_docker.get_build_cache_dir", return_value=build_dir
-            ):
+            with patch(f"{WTD}.get_build_cache_dir", return_value=build_dir):
                 spec = RepoSpec("owner", "repo", "main")
                 result = destroy_environment(spec)
 
@@ -643,25 +837,50 @@ class TestComposeOperations:
                 assert "compose" in call_args
                 assert "down" in call_args
                 assert "-v" in call_args
+                env = mock_run.call_args[1]["env"]
+                assert env["COMPOSE_FILE"] == str(build_dir / "docker-compose.yml")
+
+    @patch("subprocess.run")
+    def test_prune_all_batches_docker_calls(self, mock_run, tmp_path):
+        """Test that prune lists and removes all containers and images in batched calls."""
+
+        def fake_run(cmd, **_kwargs):
+            if cmd[:2] == ["docker", "ps"]:
+                return Mock(returncode=0, stdout="c1\trepo-main\nc2\trepo-dev\n")
+            if cmd[:2] == ["docker", "images"]:
+                return Mock(returncode=0, stdout="i1\twtd/repo:a\ni1\twtd/final:a\n")
+            return _OK
+
+        mock_run.side_effect = fake_run
+        with patch(f"{WTD}.get_cache_dir", return_value=tmp_path / "missing"):
+            assert prune_all() == 0
+
+        commands = [call[0][0] for call in mock_run.call_args_list]
+        assert ["docker", "stop", "c1", "c2"] in commands
+        assert ["docker", "rm", "-f", "c1", "c2"] in commands
+        assert ["docker", "rmi", "-f", "i1"] in commands
+        assert not any(cmd[:2] == ["docker", "inspect"] for cmd in commands)
 
 
 class TestCommands:
     """Test CLI command functions."""
 
-    @patch("worktree_docker.worktree_docker.launch_environment")
+    @patch(f"{WTD}.launch_environment")
     def test_cmd_launch(self, mock_launch):
         """Test launch command."""
         mock_launch.return_value = 0
 
-        args = Mock()
-        args.repo_spec = "owner/repo@main"
-        args.extensions = ["git", "x11"]
-        args.command = ["bash"]
-        args.rebuild = True
-        args.no_gui = False
-        args.no_gpu = False
-        args.platforms = "linux/amd64,linux/arm64"
-        args.builder = "custom_builder"
+        args = SimpleNamespace(
+            repo_spec="owner/repo@main",
+            extensions=["git", "x11"],
+            command=["bash"],
+            rebuild=True,
+            nocache=False,
+            no_gui=False,
+            no_gpu=False,
+            platforms="linux/amd64,linux/arm64",
+            builder="custom_builder",
+        )
 
         result = cmd_launch(args)
         assert result == 0
@@ -674,36 +893,35 @@ class TestCommands:
         assert call_args.platforms == ["linux/amd64", "linux/arm64"]
         assert call_args.builder_name == "custom_builder"
 
-    @patch("worktree_docker.worktree_docker.list_active_containers")
+    @patch(f"{WTD}.list_active_containers")
     def test_cmd_list_empty(self, mock_list_containers):
         """Test list command with no containers."""
         mock_list_containers.return_value = []
 
-        args = Mock()
+        args = SimpleNamespace()
         result = cmd_list(args)
         assert result == 0
 
-    @patch("worktree_docker.worktree_docker.list_active_containers")
+    @patch(f"{WTD}.list_active_containers")
     def test_cmd_list_with_containers(self, mock_list_containers):
         """Test list command with containers."""
         mock_list_containers.return_value = [
             {"name": "test-main", "status": "Up", "image": "test:latest"}
         ]
 
-        args = Mock()
+        args = SimpleNamespace()
         result = cmd_list(args)
         assert result == 0
 
-    @patch("worktree_docker.worktree_docker.prune_all")
-    @patch("worktree_docker.worktree_docker.prune_repo_environment")
+    @patch(f"{WTD}.prune_all")
+    @patch(f"{WTD}.prune_repo_environment")
     def test_cmd_prune(self, mock_prune_repo, mock_prune_all):
         """Test prune command."""
         mock_prune_all.return_value = 0
         mock_prune_repo.return_value = 0
 
         # Test general prune (no repo_spec)
-        args = Mock()
-        args.repo_spec = None
+        args = SimpleNamespace(repo_spec=None)
         result = cmd_prune(args)
         assert result == 0
         mock_prune_all.assert_called_once()
@@ -715,15 +933,14 @@ class TestCommands:
         assert result == 0
         mock_prune_repo.assert_called_once()
 
-    @patch("worktree_docker.worktree_docker.ExtensionManager")
+    @patch(f"{WTD}.ExtensionManager")
     def test_cmd_ext_list(self, mock_ext_manager):
         """Test extension list command."""
         mock_manager = Mock()
         mock_manager.list_extensions.return_value = ["base", "git", "x11"]
         mock_ext_manager.return_value = mock_manager
 
-        args = Mock()
-        args.ext_action = "list"
+        args = SimpleNamespace(ext_action="list")
 
         result = cmd_ext(args)
         assert result == 0
@@ -731,9 +948,9 @@ class TestCommands:
     @patch("subprocess.run")
     def test_cmd_doctor_all_good(self, mock_run):
         """Test doctor command when all tools are available."""
-        mock_run.return_value = Mock(returncode=0)
+        mock_run.return_value = _OK
 
-        args = Mock()
+        args = SimpleNamespace()
         result = cmd_doctor(args)
         assert result == 0
         assert mock_run.call_count == 4  # docker, compose, buildx, git
@@ -743,7 +960,7 @@ class TestCommands:
         """Test doctor command when tools are missing."""
         mock_run.side_effect = FileNotFoundError()
 
-        args = Mock()
+        args = SimpleNamespace()
         result = cmd_doctor(args)
         assert result == 1
 
@@ -751,87 +968,124 @@ class TestCommands:
 class TestMainFunction:
     """Test main entry point."""
 
-    @patch("sys.argv", ["wtd", "blooop/test_wtd@main"])
-    @patch("worktree_docker.worktree_docker.cmd_launch")
-    def test_main_launch_command(self, mock_cmd_launch):
-        """Test main function with launch command."""
-        mock_cmd_launch.return_value = 0
-
-        result = main()
-        assert result == 0
-        mock_cmd_launch.assert_called_once()
-
-    @patch("sys.argv", ["wtd", "--list"])
-    @patch("worktree_docker.worktree_docker.cmd_list")
-    def test_main_list_command(self, mock_cmd_list):
-        """Test main function with list command."""
-        mock_cmd_list.return_value = 0
-
-        result = main()
-        assert result == 0
-        mock_cmd_list.assert_called_once()
+    @pytest.mark.parametrize(
+        "argv,target",
+        [
+            (["wtd", "blooop/test_wtd@main"], "cmd_launch"),
+            (["wtd", "--list"], "cmd_list"),
+            (["wtd", "--list", "--log-level", "debug"], "cmd_list"),
+            (["wtd", "--doctor"], "cmd_doctor"),
+            (["wtd", "--no-docker", "--list"], "cmd_list"),
+        ],
+    )
+    def test_main_dispatches(self, monkeypatch, argv, target):
+        """Test main function dispatches launch and list commands."""
+        monkeypatch.setattr(sys, "argv", argv)
+        with patch(f"{WTD}.{target}", return_value=0) as mock_cmd:
+            assert main() == 0
+            mock_cmd.assert_called_once()
+
+    @pytest.mark.parametrize(
+        "argv,exec_args",
+        [
+            (
+                ["wtd", "--no-docker", "blooop/test_wtd@main#src", "git", "status"],
+                ("git", ["git", "status"]),
+            ),
+            (["wtd", "--no-docker", "blooop/test_wtd@main#src"], ("zsh", ["zsh"])),
+        ],
+    )
+    def test_main_no_docker_execs_in_worktree(self, monkeypatch, tmp_path, argv, exec_args):
+        """Test --no-docker replaces wtd with the command run from the worktree subfolder."""
+        monkeypatch.setattr(sys, "argv", argv)
+        monkeypatch.setenv("SHELL", "zsh")
+        with (
+            patch(f"{WTD}.setup_worktree", return_value=tmp_path),
+            patch("os.chdir") as mock_chdir,
+            # execvp never returns, so the mock leaves main the same way
+            patch("os.execvp", side_effect=SystemExit(0)) as mock_execvp,
+            pytest.raises(SystemExit),
+        ):
+            main()
+        mock_chdir.assert_called_once_with(tmp_path / "src")
+        mock_execvp.assert_called_once_with(*exec_args)
+
+    def test_main_no_docker_missing_command(self, monkeypatch, tmp_path):
+        """Test --no-docker returns 127 and keeps the cwd when the command cannot be started."""
+        worktree = tmp_path / "worktree"
+        worktree.mkdir()
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(
+            sys, "argv", ["wtd", "--no-docker", "blooop/test_wtd", "wtd-no-such-command"]
+        )
+        with patch(f"{WTD}.setup_worktree", return_value=worktree):
+            assert main() == 127
+        assert os.getcwd() == str(tmp_path)
 
-    @patch("sys.argv", ["wtd", "--help"])
-    def test_main_help(self):
+    def test_main_help(self, monkeypatch):
         """Test main function with help."""
+        monkeypatch.setattr(sys, "argv", ["wtd", "--help"])
         with pytest.raises(SystemExit):
             main()
 
 
+class TestExtensionTestRunner:
+    """Test the extension test runner helpers."""
+
+    def test_run_streaming_timeout_kills_grandchildren(self):
+        """Test a timeout is not held up by a grandchild that keeps the output pipe open."""
+        start = time.monotonic()
+        with pytest.raises(subprocess.TimeoutExpired):
+            run_streaming(
+                ["sh", "-c", "sleep 60 & echo started; wait"], re.compile("started"), timeout=1
+            )
+        assert time.monotonic() - start < 30
+
+
+@pytest.mark.usefixtures("fake_ids")
 class TestIntegration:
     """Integration tests for the complete workflow."""
 
     @patch("subprocess.run")
-    @patch("os.getuid", return_value=1000)
-    @patch("os.getgid", return_value=1000)
-    def test_launch_environment_full_workflow(self, mock_getgid, mock_getuid, mock_run):  # pylint: disable=unused-argument
+    def test_launch_environment_full_workflow(self, mock_run, tmp_path):
         """Test complete launch environment workflow."""
         # Mock all subprocess calls to succeed
-        mock_run.return_value = Mock(returncode=0)
+        mock_run.return_value = _OK
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            cache_dir = Path(tmpdir) / "cache"
-            worktree_dir = Path(tmpdir) / "worktree"
-            repo_dir = Path(tmpdir) / "repo.git"
-
-            # Create directories
-            cache_dir.mkdir()
-            worktree_dir.mkdir()
-            repo_dir.mkdir()
+        cache_dir, worktree_dir, repo_dir = (
+            tmp_path / sub for sub in ("cache", "worktree", "repo.git")
+        )
+        for directory in (cache_dir, worktree_dir, repo_dir):
+            directory.mkdir()
 
-            # Create mock config
-            config_file = worktree_dir / ".wtd.yml"
-            config_file.write_text("extensions: [git, x11]", encoding="utf-8")
+        # Create mock config
+        config_file = worktree_dir / ".wtd.yml"
+        config_file.write_text("extensions: [git, x11]", encoding="utf-8")
 
-            with patch("worktree_docker.worktree_docker.get_cache_dir", return_value=cache_dir):
-                with patch(
-                    "worktree_docker.worktree_docker.get_worktree_dir", return_value=worktree_dir
-                ):
-                    with patch(
-                        "worktree_docker.worktree_docker.get_repo_dir", return_value=repo_dir
-                    ):
-                        spec = RepoSpec("owner", "repo", "main")
-                        config = LaunchConfig(repo_spec=spec, extensions=["base"], rebuild=True)
-                        result = launch_environment(config)
+        with patch(f"{WTD}.get_cache_dir", return_value=cache_dir):
+            with patch(f"{WTD}.get_worktree_dir", return_value=worktree_dir):
+                with patch(f"{WTD}.get_repo_dir", return_value=repo_dir):
+                    spec = RepoSpec("owner", "repo", "main")
+                    config = LaunchConfig(repo_spec=spec, extensions=["base"], rebuild=True)
+                    result = launch_environment(config)
 
-                        assert result == 0
+                    assert result == 0
 
-                        # Check that files were created in build cache directory
-                        build_dir = cache_dir / "builds" / "owner" / "repo" / "main"
-                        assert (build_dir / "Dockerfile").exists()
-                        assert (build_dir / "docker-compose.yml").exists()
-                        assert (build_dir / "docker-bake.hcl").exists()
+                    # Check that files were created in build cache directory
+                    build_dir = cache_dir / "builds" / "owner" / "repo" / "main"
+                    assert (build_dir / "Dockerfile").exists()
+                    assert (build_dir / "docker-compose.yml").exists()
+                    assert (build_dir / "docker-bake.hcl").exists()
 
 
+@pytest.mark.usefixtures("fake_ids")
 class TestCommandParsing:
     """Test command parsing and execution."""
 
     @patch("subprocess.run")
-    @patch("os.getuid", return_value=1000)
-    @patch("os.getgid", return_value=1000)
-    def test_bash_command_parsing(self, _mock_getgid, _mock_getuid, mock_run):
+    def test_bash_command_parsing(self, mock_run):
         """Test that bash -c commands are parsed correctly."""
-        mock_run.return_value = Mock(returncode=0)
+        mock_run.return_value = _OK
 
         with tempfile.TemporaryDirectory() as tmpdir:
             spec = RepoSpec("owner", "repo", "main")
@@ -861,10 +1115,10 @@ class TestCommandParsing:
             assert "-c" in exec_call
             assert "bash -c 'pixi --version'" in exec_call
 
-    @patch("sys.argv", ["wtd", "blooop/test_wtd", "pixi", "--version"])
-    @patch("worktree_docker.worktree_docker.cmd_launch")
-    def test_command_line_parsing_with_flags(self, mock_cmd_launch):
+    @patch(f"{WTD}.cmd_launch")
+    def test_command_line_parsing_with_flags(self, mock_cmd_launch, monkeypatch):
         """Test that flags in container commands are not parsed as wtd flags."""
+        monkeypatch.setattr(sys, "argv", ["wtd", "blooop/test_wtd", "pixi", "--version"])
         mock_cmd_launch.return_value = 0
 
         result = main()
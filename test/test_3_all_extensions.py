@@ -12,6 +12,7 @@ from worktree_docker.extension_test_runner import run_extension_test_generic
 from worktree_docker.worktree_docker import ExtensionManager, auto_detect_extensions
 
 
+@pytest.mark.xdist_group("docker")
 @pytest.mark.parametrize("extension", ["base", "git", "user", "pixi", "uv"])
 def test_extension_integration(extension):
     """Test extension integration using the generic test runner."""
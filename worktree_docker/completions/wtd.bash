@@ -0,0 +1,128 @@
+# wtd & wt bash completion
+
+# Remote branches of owner/repo, cached for 5 minutes so TAB does not hit the network each time
+_wtd_cached_refs() {
+    local cache=~/.cache/wtd/refs/${1}/${2}
+    if [[ -z "$(find "${cache}" -mmin -5 2>/dev/null)" ]]; then
+        mkdir -p "${cache%/*}"
+        git -C ~/.wtd/workspaces/${1}/${2} ls-remote --heads origin 2>/dev/null | sed 's/.*refs\/heads\///' > "${cache}.$$"
+        # A failed ls-remote (offline, no such repo) keeps the previous list instead of an empty one
+        if [[ ${PIPESTATUS[0]} -eq 0 ]]; then
+            mv "${cache}.$$" "${cache}"
+        else
+            rm -f "${cache}.$$"
+        fi
+    fi
+    cat "${cache}" 2>/dev/null
+}
+
+_wtd_complete() {
+    local cur="${COMP_WORDS[COMP_CWORD]}"
+    local prev="${COMP_WORDS[COMP_CWORD-1]}"
+
+    # Don't complete after flags that take arguments
+    case "${prev}" in
+        --extensions|-e|--builder|--platforms|--log-level)
+            return 0
+            ;;
+    esac
+
+    # If current word starts with -, complete options
+    if [[ "${cur}" == -* ]]; then
+        local opts="--help -h --extensions -e --list --prune --ext-list --doctor --install --rebuild --nocache --no-gui --no-gpu --builder --platforms --log-level"
+        COMPREPLY=($(compgen -W "${opts}" -- ${cur}))
+        return 0
+    fi
+
+    # Handle repo specifications
+    if [[ "${cur}" == *@* ]]; then
+        # Has @, complete branches
+        local owner_repo="${cur%@*}"
+        local branch_prefix="${cur##*@}"
+        local owner="${owner_repo%/*}"
+        local repo="${owner_repo##*/}"
+
+        if [[ -d ~/.wtd/workspaces/${owner}/${repo} ]]; then
+            COMPREPLY=()
+
+            # Get remote branches
+            if command -v git >/dev/null 2>&1; then
+                while IFS= read -r branch; do
+                    if [[ -n "${branch}" && "${branch}" == "${branch_prefix}"* ]]; then
+                        COMPREPLY+=("${owner_repo}@${branch}")
+                    fi
+                done < <(_wtd_cached_refs "${owner}" "${repo}")
+            fi
+
+            # Get local worktree branches
+            local dir branch
+            for dir in ~/.wtd/workspaces/${owner}/${repo}/worktree-*/; do
+                [[ -d "${dir}" ]] || continue
+                branch="${dir%/}"
+                branch="${branch##*/worktree-}"
+                if [[ "${branch}" == "${branch_prefix}"* ]]; then
+                    COMPREPLY+=("${owner_repo}@${branch}")
+                fi
+            done
+        fi
+    elif [[ "${cur}" == */* ]]; then
+        # Contains slash but no @, complete repo names
+        local owner="${cur%/*}"
+        local repo_prefix="${cur##*/}"
+
+        if [[ -d ~/.wtd/workspaces/${owner} ]]; then
+            COMPREPLY=()
+            local dir repo
+            for dir in ~/.wtd/workspaces/${owner}/*/; do
+                [[ -d "${dir}" ]] || continue
+                repo="${dir%/}"
+                repo="${repo##*/}"
+                if [[ "${repo}" == "${repo_prefix}"* ]]; then
+                    COMPREPLY+=("${owner}/${repo}")
+                fi
+            done
+
+            # Don't add space after repo name so user can type @branch
+            if [[ ${#COMPREPLY[@]} -gt 0 ]]; then
+                compopt -o nospace
+            fi
+        fi
+    else
+        # No slash yet - could be command or user name
+        COMPREPLY=()
+
+        # Add commands if this looks like a command
+        local has_repo_arg=0
+        for word in "${COMP_WORDS[@]:1}"; do
+            if [[ "${word}" == */* && "${word}" != -* ]]; then
+                has_repo_arg=1
+                break
+            fi
+        done
+
+        if [[ ${has_repo_arg} -eq 0 ]]; then
+            if [[ "launch" == "${cur}"* ]]; then COMPREPLY+=("launch"); fi
+            if [[ "list" == "${cur}"* ]]; then COMPREPLY+=("list"); fi
+            if [[ "prune" == "${cur}"* ]]; then COMPREPLY+=("prune"); fi
+            if [[ "help" == "${cur}"* ]]; then COMPREPLY+=("help"); fi
+        fi
+
+        # Add user names if we have workspaces
+        local dir user
+        for dir in ~/.wtd/workspaces/*/; do
+            [[ -d "${dir}" ]] || continue
+            user="${dir%/}"
+            user="${user##*/}"
+            if [[ "${user}" == "${cur}"* ]]; then
+                COMPREPLY+=("${user}/")
+            fi
+        done
+
+        # Set compopt to not add trailing space for directory-like completions
+        if [[ ${#COMPREPLY[@]} -eq 1 && "${COMPREPLY[0]}" == */ ]]; then
+            compopt -o nospace
+        fi
+    fi
+}
+complete -F _wtd_complete wtd
+complete -F _wtd_complete wt
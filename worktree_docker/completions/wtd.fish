@@ -0,0 +1,88 @@
+# wtd & wt fish completion
+complete -c wtd -f
+complete -c wt -f
+
+# Commands
+complete -c wtd -n "not __fish_seen_subcommand_from launch list prune help" -a "launch" -d "Launch container for repo and branch"
+complete -c wtd -n "not __fish_seen_subcommand_from launch list prune help" -a "list" -d "Show active worktrees and containers"
+complete -c wtd -n "not __fish_seen_subcommand_from launch list prune help" -a "prune" -d "Remove unused containers and images"
+complete -c wtd -n "not __fish_seen_subcommand_from launch list prune help" -a "help" -d "Show help message"
+complete -c wt -n "not __fish_seen_subcommand_from launch list prune help" -a "launch" -d "Launch container for repo and branch"
+complete -c wt -n "not __fish_seen_subcommand_from launch list prune help" -a "list" -d "Show active worktrees and containers"
+complete -c wt -n "not __fish_seen_subcommand_from launch list prune help" -a "prune" -d "Remove unused containers and images"
+complete -c wt -n "not __fish_seen_subcommand_from launch list prune help" -a "help" -d "Show help message"
+
+# Options
+complete -c wtd -l install -d "Install shell auto-completion"
+complete -c wtd -l rebuild -d "Force rebuild of container"
+complete -c wtd -l nocache -d "Disable Buildx cache"
+complete -c wtd -l no-gui -d "Disable X11/GUI support"
+complete -c wtd -l no-gpu -d "Disable GPU passthrough"
+complete -c wtd -l log-level -d "Set log level" -xa "debug info warn error"
+complete -c wt -l install -d "Install shell auto-completion"
+complete -c wt -l rebuild -d "Force rebuild of container"
+complete -c wt -l nocache -d "Disable Buildx cache"
+complete -c wt -l no-gui -d "Disable X11/GUI support"
+complete -c wt -l no-gpu -d "Disable GPU passthrough"
+complete -c wt -l log-level -d "Set log level" -xa "debug info warn error"
+
+# Dynamic completion functions
+function __wtd_complete_owners
+    set -l dirs ~/.wtd/workspaces/*/
+    set -q dirs[1]; and string replace -r '^.*/([^/]+)/$' '$1' -- $dirs
+end
+
+function __wtd_complete_repos
+    set -l current (commandline -ct)
+    set -l owner (string split -f 1 / $current)
+    set -l dirs ~/.wtd/workspaces/$owner/*/
+    set -q dirs[1]; and string replace -r '^.*/([^/]+)/$' '$1' -- $dirs | string replace -r "^" "$owner/"
+end
+
+# Remote branches of owner/repo, cached for 5 minutes so TAB does not hit the network each time
+function __wtd_cached_refs
+    set -l cache ~/.cache/wtd/refs/$argv[1]/$argv[2]
+    set -l fresh (find $cache -mmin -5 2>/dev/null)
+    if test -z "$fresh"
+        mkdir -p (dirname $cache)
+        git -C ~/.wtd/workspaces/$argv[1]/$argv[2] ls-remote --heads origin 2>/dev/null | sed 's/.*refs\/heads\///' > $cache.$fish_pid
+        # A failed ls-remote (offline, no such repo) keeps the previous list instead of an empty one
+        if test $pipestatus[1] -eq 0
+            mv $cache.$fish_pid $cache
+        else
+            rm -f $cache.$fish_pid
+        end
+    end
+    cat $cache 2>/dev/null
+end
+
+function __wtd_complete_branches
+    set -l current (commandline -ct)
+    set -l owner_repo (string split -f 1 @ $current)
+    set -l owner (string split -f 1 / $owner_repo)
+    set -l repo (string split -f 2 / $owner_repo)
+    if test -d ~/.wtd/workspaces/$owner/$repo
+        # Get remote branches
+        __wtd_cached_refs $owner $repo | string replace -r "^" "$owner_repo@"
+        # Get worktree branches
+        set -l dirs ~/.wtd/workspaces/$owner/$repo/worktree-*/
+        set -q dirs[1]; and string replace -r '^.*/worktree-([^/]+)/$' '$1' -- $dirs | string replace -r "^" "$owner_repo@"
+    end
+end
+
+# Repository completion based on current input
+complete -c wtd -n "not string match -q '*/*' (commandline -ct); and not string match -q '*@*' (commandline -ct)" -a "(__wtd_complete_owners)" -d "Owner"
+complete -c wtd -n "string match -q '*/*' (commandline -ct); and not string match -q '*@*' (commandline -ct)" -a "(__wtd_complete_repos)" -d "Repository"
+complete -c wtd -n "string match -q '*@*' (commandline -ct)" -a "(__wtd_complete_branches)" -d "Branch"
+complete -c wt -n "not string match -q '*/*' (commandline -ct); and not string match -q '*@*' (commandline -ct)" -a "(__wtd_complete_owners)" -d "Owner"
+complete -c wt -n "string match -q '*/*' (commandline -ct); and not string match -q '*@*' (commandline -ct)" -a "(__wtd_complete_repos)" -d "Repository"
+complete -c wt -n "string match -q '*@*' (commandline -ct)" -a "(__wtd_complete_branches)" -d "Branch"
+
+# Existing worktrees as owner/repo@branch, listed on TAB rather than at shell startup
+function __wtd_complete_worktrees
+    set -l dirs ~/.wtd/workspaces/*/*/worktree-*/
+    set -q dirs[1]; and string replace -r '^.*/([^/]+)/([^/]+)/worktree-([^/]+)/$' '$1/$2@$3' -- $dirs
+end
+
+complete -c wtd -n 'not string match -q -- "-*" (commandline -ct)' -a "(__wtd_complete_worktrees)" -d "Existing worktree"
+complete -c wt -n 'not string match -q -- "-*" (commandline -ct)' -a "(__wtd_complete_worktrees)" -d "Existing worktree"
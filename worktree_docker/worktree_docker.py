@@ -6,17 +6,24 @@ isolated development environments for each repository branch.
 """
 
 import sys
+import shutil
 import subprocess
 import logging
 import argparse
+import copy
+import fcntl
 import time
 import json
 import yaml
-import hashlib
+import heapq
+import mmap
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Any
+from functools import cached_property, lru_cache
+from itertools import chain
+from typing import List, Optional, Dict, Any, Tuple
 from pathlib import Path
 
 from .autocomplete import install_shell_completion
@@ -26,6 +33,12 @@ try:
 except ImportError:
     iterfzf = None
 
+# libyaml bindings parse several times faster; PyYAML builds without them fall back
+try:
+    from yaml import CSafeLoader as _YLoader
+except ImportError:
+    from yaml import SafeLoader as _YLoader
+
 
 @dataclass
 class RepoSpec:
@@ -60,11 +73,15 @@ class RepoSpec:
             result += f"#{self.subfolder}"
         return result
 
-    @property
+    @cached_property
+    def safe_branch(self) -> str:
+        """Branch name usable in paths and worktree names (computed once)."""
+        return self.branch.replace("/", "-")
+
+    @cached_property
     def compose_project_name(self) -> str:
-        """Generate Docker Compose project name."""
-        safe_branch = self.branch.replace("/", "-").replace("_", "-")
-        return f"{self.repo}-{safe_branch}"
+        """Generate Docker Compose project name (computed once)."""
+        return f"{self.repo}-{self.safe_branch.replace('_', '-')}"
 
 
 @dataclass
@@ -77,13 +94,39 @@ class Extension:
     files: Dict[str, str] = field(default_factory=dict)  # Additional files to copy
     manifest: Dict[str, Any] = field(default_factory=dict)  # Extension manifest data
 
-    @property
+    @cached_property
+    def canonical_fragment(self) -> bytes:
+        """Canonical, encoded JSON serialization of the compose fragment (computed once)."""
+        return json.dumps(self.compose_fragment, sort_keys=True, separators=(",", ":")).encode()
+
+    @cached_property
     def hash(self) -> str:
-        """Generate SHA256 hash for cache tagging."""
-        content = f"{self.dockerfile_content}{json.dumps(self.compose_fragment, sort_keys=True)}"
+        """Generate a 12 character BLAKE2b hash for cache tagging (computed once)."""
+        # Imported on first use: hashlib loads the OpenSSL bindings, which only the launch path needs
+        import hashlib
+
+        # Feed each piece separately rather than hashing one concatenated copy of everything
+        digest = hashlib.blake2b(digest_size=6)
+        digest.update(self.dockerfile_content.encode())
+        digest.update(self.canonical_fragment)
         for filename, file_content in sorted(self.files.items()):
-            content += f"{filename}:{file_content}"
-        return hashlib.sha256(content.encode()).hexdigest()[:12]
+            digest.update(b"\0" + filename.encode() + b"\0")
+            digest.update(file_content.encode())
+        return digest.hexdigest()
+
+    @cached_property
+    def stability_rank(self) -> int:
+        """How rarely the extension's layer changes: 0 for system packages up to 99 for scripts."""
+        return int(self.manifest.get("stability_rank", 50))
+
+    @cached_property
+    def detect_patterns(self) -> Dict[str, Tuple[frozenset, List[re.Pattern]]]:
+        """Auto_detect file and directory patterns from the manifest, split once per kind."""
+        auto_detect_config = self.manifest.get("auto_detect") or {}
+        return {
+            kind: _split_patterns(auto_detect_config.get(kind, []))
+            for kind in ("files", "directories")
+        }
 
 
 class RenvConfig:
@@ -102,7 +145,7 @@ class RenvConfig:
                     with open(config_path, "r", encoding="utf-8") as f:
                         if config_file.endswith(".json"):
                             return json.load(f)
-                        return yaml.safe_load(f) or {}
+                        return yaml.load(f, Loader=_YLoader) or {}
                 except Exception as e:
                     logging.warning(f"Failed to load {config_file}: {e}")
         return {}
@@ -123,6 +166,33 @@ class RenvConfig:
         return self.config.get("platforms", ["linux/amd64"])
 
 
+def _read_extra_files(ext_dir: Path, skip: frozenset) -> Dict[str, str]:
+    """Read the regular, non-hidden files in ext_dir whose names are not in skip."""
+    files = {}
+    # DirEntry.is_file() uses the type from readdir, so only the files read are opened
+    with os.scandir(ext_dir) as entries:
+        for entry in entries:
+            if entry.name in skip or entry.name.startswith(".") or not entry.is_file():
+                continue
+            files[entry.name] = Path(entry.path).read_text(encoding="utf-8")
+    return files
+
+
+def dir_signature(path: Path) -> tuple:
+    """Name, size and mtime of every entry in path, so editing any of its files changes it."""
+    with os.scandir(path) as entries:
+        return tuple(
+            sorted(
+                (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns) for entry in entries
+            )
+        )
+
+
+# Built-in extensions keyed by extension directory, each stored with the dir_signature it
+# was read at (None if it failed to load); shared by every ExtensionManager
+_BUILTIN_EXT_CACHE: Dict[str, Tuple[tuple, Optional[Extension]]] = {}
+
+
 class ExtensionManager:
     """Manages extensions and their definitions."""
 
@@ -133,22 +203,43 @@ class ExtensionManager:
         # Load extensions from global extensions directory
         self.global_extensions_dir = Path(__file__).parent.parent / "extensions"
         self._builtin_extensions = self._load_builtin_extensions()
+        self._sorted_builtin_names = sorted(self._builtin_extensions)
 
     def _load_builtin_extensions(self) -> Dict[str, Extension]:
-        """Load built-in extension definitions from the global extensions directory."""
+        """Load built-in extension definitions, rereading only directories that changed."""
         extensions = {}
 
         if not self.global_extensions_dir.exists():
             print(f"Warning: Global extensions directory not found: {self.global_extensions_dir}")
             return extensions
 
-        for ext_dir in self.global_extensions_dir.iterdir():
-            if ext_dir.is_dir():
-                try:
-                    extension = self._load_extension_from_dir(ext_dir.name, ext_dir)
-                    extensions[ext_dir.name] = extension
-                except Exception as e:
-                    print(f"Warning: Failed to load extension {ext_dir.name}: {e}")
+        def load(ext_dir: Path) -> Optional[Extension]:
+            try:
+                return self._load_extension_from_dir(ext_dir.name, ext_dir)
+            except Exception as e:
+                print(f"Warning: Failed to load extension {ext_dir.name}: {e}")
+                return None
+
+        with os.scandir(self.global_extensions_dir) as entries:
+            ext_dirs = [Path(entry.path) for entry in entries if entry.is_dir()]
+        signatures = {ext_dir: dir_signature(ext_dir) for ext_dir in ext_dirs}
+        stale = [
+            ext_dir
+            for ext_dir in ext_dirs
+            if _BUILTIN_EXT_CACHE.get(str(ext_dir), (None,))[0] != signatures[ext_dir]
+        ]
+        if stale:
+            # Each directory is independent file I/O, which releases the GIL, so read them
+            # concurrently
+            with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 4)) as executor:
+                for ext_dir, extension in zip(stale, executor.map(load, stale)):
+                    _BUILTIN_EXT_CACHE[str(ext_dir)] = (signatures[ext_dir], extension)
+
+        # Every manager gets its own copies, so mutating one cannot leak into another manager
+        for ext_dir in ext_dirs:
+            extension = _BUILTIN_EXT_CACHE[str(ext_dir)][1]
+            if extension is not None:
+                extensions[ext_dir.name] = copy.deepcopy(extension)
 
         return extensions
 
@@ -161,24 +252,21 @@ class ExtensionManager:
         if dockerfile_path.exists():
             dockerfile_content = dockerfile_path.read_text(encoding="utf-8")
 
+        # YAML is parsed straight from bytes; libyaml detects the encoding itself
         compose_fragment = {}
         if compose_path.exists():
-            with open(compose_path, "r", encoding="utf-8") as f:
-                compose_fragment = yaml.safe_load(f) or {}
+            compose_fragment = yaml.load(compose_path.read_bytes(), Loader=_YLoader) or {}
 
         # Load manifest data if available
         manifest_path = ext_dir / "worktree_docker.yml"
         manifest = {}
         if manifest_path.exists():
-            with open(manifest_path, "r", encoding="utf-8") as f:
-                manifest = yaml.safe_load(f) or {}
+            manifest = yaml.load(manifest_path.read_bytes(), Loader=_YLoader) or {}
 
         # Load any additional files (including test.sh)
-        files = {}
-        for file_path in ext_dir.glob("*"):
-            if file_path.name not in ["Dockerfile", "docker-compose.yml", "worktree_docker.yml"]:
-                if file_path.is_file():
-                    files[file_path.name] = file_path.read_text(encoding="utf-8")
+        files = _read_extra_files(
+            ext_dir, frozenset(("Dockerfile", "docker-compose.yml", "worktree_docker.yml"))
+        )
 
         return Extension(
             name=name,
@@ -208,16 +296,13 @@ class ExtensionManager:
         if dockerfile_path.exists():
             dockerfile_content = dockerfile_path.read_text(encoding="utf-8")
 
+        # YAML is parsed straight from bytes; libyaml detects the encoding itself
         compose_fragment = {}
         if compose_path.exists():
-            with open(compose_path, "r", encoding="utf-8") as f:
-                compose_fragment = yaml.safe_load(f) or {}
+            compose_fragment = yaml.load(compose_path.read_bytes(), Loader=_YLoader) or {}
 
         # Load any additional files
-        files = {}
-        for file_path in ext_dir.glob("*"):
-            if file_path.name not in ["Dockerfile", "docker-compose.fragment.yml"]:
-                files[file_path.name] = file_path.read_text(encoding="utf-8")
+        files = _read_extra_files(ext_dir, frozenset(("Dockerfile", "docker-compose.fragment.yml")))
 
         return Extension(
             name=name,
@@ -228,14 +313,17 @@ class ExtensionManager:
 
     def list_extensions(self, repo_path: Optional[Path] = None) -> List[str]:
         """List all available extensions."""
-        extensions = set(self._builtin_extensions.keys())
+        if not repo_path:
+            return list(self._sorted_builtin_names)
 
-        if repo_path:
-            local_exts_dir = repo_path / ".wtd" / "exts"
-            if local_exts_dir.exists():
-                extensions.update(d.name for d in local_exts_dir.iterdir() if d.is_dir())
+        local_exts_dir = repo_path / ".wtd" / "exts"
+        if not local_exts_dir.exists():
+            return list(self._sorted_builtin_names)
+        with os.scandir(local_exts_dir) as entries:
+            local = sorted(entry.name for entry in entries if entry.is_dir())
 
-        return sorted(extensions)
+        # Both inputs are sorted, so merging keeps the result sorted and duplicates adjacent
+        return list(dict.fromkeys(heapq.merge(self._sorted_builtin_names, local)))
 
     def discover_repo_extensions(self, repo_path: Path) -> List[str]:
         """Discover extensions defined within repository subdirectories by grepping for worktree_docker.yml files."""
@@ -263,15 +351,14 @@ class ExtensionManager:
                         continue
 
                     try:
-                        with open(manifest_path, "r", encoding="utf-8") as f:
-                            manifest_data = yaml.safe_load(f)
-                            if manifest_data and "name" in manifest_data:
-                                ext_name = manifest_data["name"]
-                                if ext_name not in discovered_extensions:
-                                    discovered_extensions.append(ext_name)
-                                    logging.info(
-                                        f"Discovered extension '{ext_name}' in {manifest_file}"
-                                    )
+                        manifest_data = yaml.load(manifest_path.read_bytes(), Loader=_YLoader)
+                        if manifest_data and "name" in manifest_data:
+                            ext_name = manifest_data["name"]
+                            if ext_name not in discovered_extensions:
+                                discovered_extensions.append(ext_name)
+                                logging.info(
+                                    f"Discovered extension '{ext_name}' in {manifest_file}"
+                                )
                     except Exception as e:
                         logging.warning(f"Failed to parse extension manifest {manifest_file}: {e}")
 
@@ -286,9 +373,17 @@ def get_cache_dir() -> Path:
     cache_dir = os.getenv("WTD_CACHE_DIR")
     if cache_dir:
         return Path(cache_dir)
+    return _find_cache_dir(Path.cwd())
+
 
-    # Search upward for .wtd directory
-    current = Path.cwd()
+@lru_cache(maxsize=8)
+def _find_cache_dir(start: Path) -> Path:
+    """Search upward from start for a .wtd directory, falling back to ~/.wtd.
+
+    Memoized per starting directory: every path helper goes through get_cache_dir, and the
+    walk stats each ancestor. The memo only lives for one main() call; see clear_cache_dir_memo.
+    """
+    current = start
     while current != current.parent:
         wtd_dir = current / ".wtd"
         if wtd_dir.exists() and wtd_dir.is_dir():
@@ -299,25 +394,37 @@ def get_cache_dir() -> Path:
     return Path.home() / ".wtd"
 
 
+def clear_cache_dir_memo() -> None:
+    """Forget memoized .wtd lookups, for when .wtd directories are created or removed in-process."""
+    _find_cache_dir.cache_clear()
+
+
 def get_workspaces_dir() -> Path:
     """Get workspaces directory."""
     return get_cache_dir() / "workspaces"
 
 
+def _subdir_names(path: Path) -> List[str]:
+    """Names of the directories in path, or [] if it does not exist.
+
+    scandir entries answer is_dir from the directory listing itself, so no entry is stat'ed
+    unless it is a symlink.
+    """
+    try:
+        with os.scandir(path) as entries:
+            return [entry.name for entry in entries if entry.is_dir()]
+    except FileNotFoundError:
+        return []
+
+
 def get_available_users() -> List[str]:
     """Get list of available users from workspaces directory."""
-    workspaces_dir = get_workspaces_dir()
-    if not workspaces_dir.exists():
-        return []
-    return [d.name for d in workspaces_dir.iterdir() if d.is_dir()]
+    return _subdir_names(get_workspaces_dir())
 
 
 def get_available_repos(user: str) -> List[str]:
     """Get list of available repositories for a user."""
-    user_dir = get_workspaces_dir() / user
-    if not user_dir.exists():
-        return []
-    return [d.name for d in user_dir.iterdir() if d.is_dir()]
+    return _subdir_names(get_workspaces_dir() / user)
 
 
 def get_available_branches(repo_spec: RepoSpec) -> List[str]:
@@ -343,23 +450,33 @@ def get_available_branches(repo_spec: RepoSpec) -> List[str]:
         except Exception:
             pass
 
-    # Get branches from individual ref files in refs/heads/
-    refs_heads_dir = repo_dir / "refs" / "heads"
-    if refs_heads_dir.exists():
+    # Get branches from individual ref files in refs/heads/, including nested ones (feature/x)
+    pending = [(repo_dir / "refs" / "heads", "")]
+    while pending:
+        ref_dir, prefix = pending.pop()
         try:
-            for ref_file in refs_heads_dir.iterdir():
-                if ref_file.is_file():
-                    branches.add(ref_file.name)
+            with os.scandir(ref_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        pending.append((Path(entry.path), f"{prefix}{entry.name}/"))
+                    elif entry.is_file():
+                        branches.add(prefix + entry.name)
         except Exception:
             pass
 
+    # Worktree directories are named after the branch with "/" replaced by "-"; known refs
+    # undo that exactly, the heuristic below only covers worktrees whose branch has no ref
+    branch_by_safe_name = {branch.replace("/", "-"): branch for branch in branches}
+
     # Also get branches from existing worktrees
     try:
-        for item in repo_dir.iterdir():
-            if item.is_dir() and item.name.startswith("worktree-"):
-                branch = item.name[9:]  # Remove "worktree-" prefix
+        for name in _subdir_names(repo_dir):
+            if name.startswith("worktree-"):
+                branch = name[9:]  # Remove "worktree-" prefix
+                if branch in branch_by_safe_name:
+                    actual_branch = branch_by_safe_name[branch]
                 # Convert hyphens back to slashes for feature branches
-                if "-" in branch and branch not in [
+                elif "-" in branch and branch not in [
                     "main",
                     "master",
                     "develop",
@@ -373,18 +490,25 @@ def get_available_branches(repo_spec: RepoSpec) -> List[str]:
     except Exception:
         pass
 
-    return sorted(list(branches))
+    return sorted(branches)
 
 
 def get_available_repo_branch_combinations() -> List[str]:
     """Get all available repo@branch combinations for fuzzy finder (fast, local-only)."""
     combinations = []
+    repo_specs = [
+        RepoSpec(user, repo, "main")
+        for user in get_available_users()
+        for repo in get_available_repos(user)
+    ]
 
-    for user in get_available_users():
-        for repo in get_available_repos(user):
-            repo_spec = RepoSpec(user, repo, "main")
-            branches = get_available_branches(repo_spec)
-
+    # Each repo's refs and worktrees are read independently; overlapping the file system
+    # round trips matters most when the workspaces live on a network mount
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        for repo_spec, branches in zip(
+            repo_specs, executor.map(get_available_branches, repo_specs)
+        ):
+            user, repo = repo_spec.owner, repo_spec.repo
             if branches:
                 for branch in branches:
                     combinations.append(f"{user}/{repo}@{branch}")
@@ -407,8 +531,8 @@ def interactive_repo_selection() -> Optional[str]:
         print("Error: Interactive selection requires a terminal.")
         print("Existing repo@branch combinations:")
         combinations = get_available_repo_branch_combinations()
-        for combo in combinations:
-            print(f"  {combo}")
+        if combinations:
+            print("\n".join(f"  {combo}" for combo in combinations))
         return None
 
     combinations = get_available_repo_branch_combinations()
@@ -432,15 +556,13 @@ def interactive_repo_selection() -> Optional[str]:
     except Exception as e:
         print(f"Error during selection: {e}")
         print("Available combinations:")
-        for combo in combinations:
-            print(f"  {combo}")
+        print("\n".join(f"  {combo}" for combo in combinations))
         return None
 
 
 def get_build_cache_dir(repo_spec: RepoSpec) -> Path:
     """Get build cache directory for a specific repo spec."""
-    safe_branch = repo_spec.branch.replace("/", "-")
-    return get_cache_dir() / "builds" / repo_spec.owner / repo_spec.repo / safe_branch
+    return get_cache_dir() / "builds" / repo_spec.owner / repo_spec.repo / repo_spec.safe_branch
 
 
 def get_repo_dir(repo_spec: RepoSpec) -> Path:
@@ -450,27 +572,63 @@ def get_repo_dir(repo_spec: RepoSpec) -> Path:
 
 def get_worktree_dir(repo_spec: RepoSpec) -> Path:
     """Get worktree directory for a specific branch."""
-    safe_branch = repo_spec.branch.replace("/", "-")
-    return get_repo_dir(repo_spec) / f"worktree-{safe_branch}"
+    return get_repo_dir(repo_spec) / f"worktree-{repo_spec.safe_branch}"
+
+
+def _split_patterns(patterns: List[str]) -> Tuple[frozenset, List[re.Pattern]]:
+    """Split auto_detect patterns into lowercased exact names and compiled regexes.
+
+    Most manifest patterns are anchored literals such as ``^pixi\\.toml$``; those become a
+    set lookup, and only the remaining patterns are compiled (case-insensitively).
+    """
+    literals = set()
+    regexes = []
+    for pattern in patterns:
+        body = pattern[1:-1] if pattern.startswith("^") and pattern.endswith("$") else None
+        literal = re.sub(r"\\(.)", r"\1", body) if body is not None else None
+        if literal is not None and re.escape(literal) == body:
+            literals.add(literal.lower())
+        else:
+            regexes.append(re.compile(pattern, re.IGNORECASE))
+    return frozenset(literals), regexes
+
+
+def _first_match(
+    patterns: Tuple[frozenset, List[re.Pattern]], names: Dict[str, str]
+) -> Optional[str]:
+    """Return a name matched by the patterns; names maps lowercased names to the real ones."""
+    literals, regexes = patterns
+    for literal in literals:
+        if literal in names:
+            return names[literal]
+    for pattern in regexes:
+        for name in names.values():
+            if pattern.match(name):
+                return name
+    return None
 
 
 def auto_detect_extensions(repo_path: Path, extension_manager: "ExtensionManager") -> List[str]:
     """Auto-detect extensions based on patterns defined in extension manifests."""
-    detected_extensions = []
+    # Insertion-ordered dict used as an ordered set
+    detected_extensions: Dict[str, None] = {}
 
     try:
         # Get all files and directories in the repository root
         if not repo_path.exists():
-            return detected_extensions
+            return []
 
-        repo_files = []
-        repo_directories = []
+        # Lowercased name -> name, so exact-name patterns are a dict lookup
+        repo_files: Dict[str, str] = {}
+        repo_directories: Dict[str, str] = {}
 
-        for item in repo_path.iterdir():
-            if item.is_file():
-                repo_files.append(item.name)
-            elif item.is_dir():
-                repo_directories.append(item.name)
+        # DirEntry caches the file type from readdir, so no stat per entry
+        with os.scandir(repo_path) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    repo_files.setdefault(entry.name.lower(), entry.name)
+                elif entry.is_dir():
+                    repo_directories.setdefault(entry.name.lower(), entry.name)
 
         # Check each extension's auto-detection patterns
         for ext_name in extension_manager.list_extensions():
@@ -481,44 +639,28 @@ def auto_detect_extensions(repo_path: Path, extension_manager: "ExtensionManager
             # Check for always_load extensions first
             if extension.manifest.get("always_load", False):
                 if ext_name not in detected_extensions:
-                    detected_extensions.append(ext_name)
+                    detected_extensions[ext_name] = None
                     logging.info(f"Always-load extension '{ext_name}' added")
                 continue
 
-            if "auto_detect" not in extension.manifest:
-                continue
-
-            auto_detect_config = extension.manifest["auto_detect"]
-            if not auto_detect_config:  # Skip if auto_detect is None or empty
+            auto_detect_config = extension.manifest.get("auto_detect")
+            if not auto_detect_config:  # Skip if auto_detect is missing, None or empty
                 continue
 
             detected = False
 
             # Check file patterns
-            if "files" in auto_detect_config:
-                for pattern in auto_detect_config["files"]:
-                    for filename in repo_files:
-                        if re.match(pattern, filename, re.IGNORECASE):
-                            detected = True
-                            logging.info(
-                                f"Auto-detected extension '{ext_name}' from file '{filename}'"
-                            )
-                            break
-                    if detected:
-                        break
+            filename = _first_match(extension.detect_patterns["files"], repo_files)
+            if filename is not None:
+                detected = True
+                logging.info(f"Auto-detected extension '{ext_name}' from file '{filename}'")
 
             # Check directory patterns
-            if not detected and "directories" in auto_detect_config:
-                for pattern in auto_detect_config["directories"]:
-                    for dirname in repo_directories:
-                        if re.match(pattern, dirname, re.IGNORECASE):
-                            detected = True
-                            logging.info(
-                                f"Auto-detected extension '{ext_name}' from directory '{dirname}'"
-                            )
-                            break
-                    if detected:
-                        break
+            if not detected:
+                dirname = _first_match(extension.detect_patterns["directories"], repo_directories)
+                if dirname is not None:
+                    detected = True
+                    logging.info(f"Auto-detected extension '{ext_name}' from directory '{dirname}'")
 
             # Check host paths
             if not detected and "host_paths" in auto_detect_config:
@@ -531,13 +673,13 @@ def auto_detect_extensions(repo_path: Path, extension_manager: "ExtensionManager
                         )
                         break
 
-            if detected and ext_name not in detected_extensions:
-                detected_extensions.append(ext_name)
+            if detected:
+                detected_extensions[ext_name] = None
 
     except Exception as e:
         logging.warning(f"Failed to auto-detect extensions: {e}")
 
-    return detected_extensions
+    return list(detected_extensions)
 
 
 def resolve_extension_dependencies(
@@ -569,8 +711,14 @@ def resolve_extension_dependencies(
         if ext_name not in resolved:
             resolved.append(ext_name)
 
-    # Resolve all extensions
-    for ext in extensions[:]:  # Copy list to avoid modification during iteration
+    def stability_rank(ext_name: str) -> int:
+        extension = extension_manager.get_extension(ext_name)
+        return extension.stability_rank if extension else 50
+
+    # Resolve all extensions, most stable first so that editing a volatile extension only
+    # invalidates the layers at the end of the chain; dependencies still precede their users.
+    # sorted() is stable and copies, so the list can grow during iteration
+    for ext in sorted(extensions, key=stability_rank):
         resolve_ext(ext)
 
     return resolved
@@ -584,11 +732,17 @@ def setup_bare_repo(repo_spec: RepoSpec) -> Path:
     if not repo_dir.exists():
         logging.info(f"Cloning bare repository: {repo_url}")
         repo_dir.parent.mkdir(parents=True, exist_ok=True)
+        # Partial clone: blobs are fetched when a worktree checks them out, not all up front.
+        # WTD_CLONE_FILTER picks another filter; set it empty for a full clone
+        clone_filter = os.getenv("WTD_CLONE_FILTER", "blob:none")
+        clone_cmd = ["git", "clone", "--bare"]
+        if clone_filter:
+            clone_cmd.append(f"--filter={clone_filter}")
         try:
-            subprocess.run(["git", "clone", "--bare", repo_url, str(repo_dir)], check=True)
+            subprocess.run([*clone_cmd, repo_url, str(repo_dir)], check=True)
         except Exception as e:
             logging.warning(f"SSH clone failed ({e}), retrying with HTTPS: {https_url}")
-            subprocess.run(["git", "clone", "--bare", https_url, str(repo_dir)], check=True)
+            subprocess.run([*clone_cmd, https_url, str(repo_dir)], check=True)
     else:
         logging.info(f"Fetching updates for: {repo_url}")
         subprocess.run(["git", "-C", str(repo_dir), "fetch", "--all"], check=True)
@@ -596,6 +750,23 @@ def setup_bare_repo(repo_spec: RepoSpec) -> Path:
     return repo_dir
 
 
+def _local_branch_exists(repo_dir: Path, branch: str) -> bool:
+    """Whether the repository has refs/heads/<branch>, read from its loose and packed refs."""
+    ref = f"refs/heads/{branch}"
+    if (repo_dir / ref).is_file():
+        return True
+    try:
+        with (repo_dir / "packed-refs").open("rb") as packed:
+            if not os.fstat(packed.fileno()).st_size:
+                return False
+            # Each packed ref is "<sha> <ref>\n"; searching the mapped file avoids splitting a
+            # large ref list into lines, and the kernel only pages in what the search touches
+            with mmap.mmap(packed.fileno(), 0, access=mmap.ACCESS_READ) as packed_map:
+                return packed_map.find(f" {ref}\n".encode()) != -1
+    except FileNotFoundError:
+        return False
+
+
 def setup_worktree(repo_spec: RepoSpec) -> Path:
     """Set up git worktree for the specified branch."""
     repo_dir = get_repo_dir(repo_spec)
@@ -604,44 +775,50 @@ def setup_worktree(repo_spec: RepoSpec) -> Path:
     # Ensure bare repo exists
     setup_bare_repo(repo_spec)
 
-    if not worktree_dir.exists():
+    if worktree_dir.exists():
+        logging.info(f"Worktree already exists: {worktree_dir}")
+        return worktree_dir
+
+    # Runs for the same repo take turns creating worktrees, so when two start on one branch
+    # the second finds the first one's worktree instead of failing to check the branch out again
+    with open(repo_dir / "wtd.lock", "a", encoding="utf-8") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if worktree_dir.exists():
+            logging.info(f"Worktree created concurrently: {worktree_dir}")
+            return worktree_dir
+
         logging.info(f"Creating worktree for branch: {repo_spec.branch}")
 
-        # Check if branch exists, if not create it
-        try:
-            # Try to create worktree with existing branch
-            subprocess.run(
-                [
-                    "git",
-                    "-C",
-                    str(repo_dir),
-                    "worktree",
-                    "add",
-                    str(worktree_dir),
-                    repo_spec.branch,
-                ],
-                check=True,
-            )
-        except subprocess.CalledProcessError:
+        worktree_add = ["git", "-C", str(repo_dir), "worktree", "add"]
+        attempts = [
+            # Create worktree with existing branch
+            [*worktree_add, str(worktree_dir), repo_spec.branch],
             # Branch doesn't exist, create new branch and worktree
+            [*worktree_add, "-b", repo_spec.branch, str(worktree_dir)],
+        ]
+        # Start with the command the local refs point to, so the usual case is one git call;
+        # the other one stays as a fallback for refs this check cannot see
+        if not _local_branch_exists(repo_dir, repo_spec.branch):
             logging.info(f"Branch {repo_spec.branch} doesn't exist, creating new branch")
-            subprocess.run(
-                [
-                    "git",
-                    "-C",
-                    str(repo_dir),
-                    "worktree",
-                    "add",
-                    "-b",
-                    repo_spec.branch,
-                    str(worktree_dir),
-                ],
-                check=True,
-            )
-
-        time.sleep(0.1)  # Allow filesystem to sync
-    else:
-        logging.info(f"Worktree already exists: {worktree_dir}")
+            attempts.reverse()
+        for attempt, cmd in enumerate(attempts):
+            try:
+                # git's progress banner is dropped; stderr is kept for the failure message
+                subprocess.run(
+                    cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+                )
+                break
+            except subprocess.CalledProcessError as e:
+                if attempt == len(attempts) - 1:
+                    logging.error(f"git worktree add failed: {e.stderr.strip()}")
+                    raise
+                logging.debug(f"git worktree add failed, retrying: {e.stderr.strip()}")
+
+        # git writes the worktree's .git file before exiting, so this normally passes at once;
+        # the bounded poll only covers filesystems that surface it late
+        deadline = time.monotonic() + 2.0
+        while not (worktree_dir / ".git").exists() and time.monotonic() < deadline:
+            time.sleep(0.005)
 
     return worktree_dir
 
@@ -683,33 +860,128 @@ def ensure_buildx_builder(builder_name: str = "wtd_builder") -> bool:
         return False
 
 
-def generate_dockerfile(extensions: List[Extension], base_image: str, build_dir: Path) -> str:
-    """Generate Dockerfile combining all extensions."""
+def write_if_changed(path: Path, content: str) -> bool:
+    """Write content to path unless the file already holds exactly that; True if written.
+
+    Leaving unchanged build files untouched keeps their mtimes stable between launches.
+    """
+    data = content.encode()
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    path.write_bytes(data)
+    return True
+
+
+def _render_build_context(
+    extensions: List[Extension], base_image: str, platforms: List[str]
+) -> Tuple[str, Dict[str, str], str]:
+    """Render the combined Dockerfile, per-layer Dockerfiles and bake file in one pass.
+
+    Returns (Dockerfile content, {file name: layer Dockerfile content}, bake file content).
+    """
     lines = [f"FROM {base_image} as base"]
+    layer_dockerfiles = {}
+    targets = []
 
-    # Add each extension's Dockerfile content
+    # Convert platforms list to proper HCL array syntax
+    platforms_hcl = "[" + ", ".join([f'"{platform}"' for platform in platforms]) + "]"
+
+    # Layer cache location; WTD_BUILDX_CACHE lets it outlive the per-environment build dir
+    cache_dir = os.getenv("WTD_BUILDX_CACHE") or ".buildx-cache"
+    # WTD_CACHE_REGISTRY additionally shares each target's layers through a registry cache ref;
+    # extension refs are shared by every environment, the final one is per extension set
+    cache_registry = (os.getenv("WTD_CACHE_REGISTRY") or "").rstrip("/")
+
+    def cache_attributes(ref_name: str) -> str:
+        # ref_name is the <name>:<tag> under the registry
+        sources = [f'"type=local,src={cache_dir}"']
+        destinations = [f'"type=local,dest={cache_dir},mode=max"']
+        if cache_registry:
+            ref = f"{cache_registry}/{ref_name}"
+            sources.append(f'"type=registry,ref={ref}"')
+            destinations.append(f'"type=registry,ref={ref},mode=max"')
+        return (
+            f"    cache-from = [{', '.join(sources)}]\n    cache-to = [{', '.join(destinations)}]"
+        )
+
+    current_image = base_image
     for ext in extensions:
-        if ext.dockerfile_content.strip():
-            lines.append(f"\n# Extension: {ext.name}")
-            lines.append(ext.dockerfile_content.strip())
+        content = ext.dockerfile_content.strip()
+        if not content:
+            continue
+
+        # Combined Dockerfile section for this extension
+        lines.append(f"\n# Extension: {ext.name}")
+        lines.append(content)
+
+        # Bake target and individual Dockerfile for this extension's layer
+        tag = f"wtd/{ext.name}:{ext.hash}"
+        targets.append(f"""
+target "ext-{ext.name}" {{
+    context = "."
+    dockerfile = "Dockerfile.{ext.name}"
+    tags = ["{tag}"]
+    platforms = {platforms_hcl}
+{cache_attributes(f"{ext.name}:buildcache")}
+}}""")
+        layer_dockerfiles[f"Dockerfile.{ext.name}"] = (
+            f"FROM {current_image}\n{ext.dockerfile_content}"
+        )
+        current_image = tag
 
     # Ensure we end up in the right working directory
     lines.append("\nWORKDIR /workspace")
     lines.append('CMD ["bash"]')
 
-    dockerfile_content = "\n".join(lines)
+    # Final target combining all extensions
+    final_tag = "-".join([ext.hash for ext in extensions])
+    targets.append(f"""
+target "final" {{
+    context = "."
+    dockerfile = "Dockerfile"
+    tags = ["wtd/final:{final_tag}"]
+    platforms = {platforms_hcl}
+{cache_attributes(f"final:{compute_image_hash(extensions)}")}
+}}""")
+
+    return "\n".join(lines), layer_dockerfiles, "\n".join(targets)
+
+
+def emit_build_context(
+    extensions: List[Extension], base_image: str, platforms: List[str], build_dir: Path
+) -> Tuple[str, str]:
+    """Write the Dockerfile, layer Dockerfiles and docker-bake.hcl for a build.
+
+    Returns (Dockerfile content, bake file content).
+    """
+    dockerfile_content, layer_dockerfiles, bake_content = _render_build_context(
+        extensions, base_image, platforms
+    )
+    build_dir.mkdir(parents=True, exist_ok=True)
+    write_if_changed(build_dir / "Dockerfile", dockerfile_content)
+    for file_name, content in layer_dockerfiles.items():
+        write_if_changed(build_dir / file_name, content)
+    write_if_changed(build_dir / "docker-bake.hcl", bake_content)
+    return dockerfile_content, bake_content
+
+
+def generate_dockerfile(extensions: List[Extension], base_image: str, build_dir: Path) -> str:
+    """Generate Dockerfile combining all extensions."""
+    dockerfile_content, _, _ = _render_build_context(extensions, base_image, [])
 
     # Ensure build directory exists
     build_dir.mkdir(parents=True, exist_ok=True)
 
     # Write Dockerfile to build directory
-    dockerfile_path = build_dir / "Dockerfile"
-    dockerfile_path.write_text(dockerfile_content, encoding="utf-8")
+    write_if_changed(build_dir / "Dockerfile", dockerfile_content)
 
     return dockerfile_content
 
 
-@dataclass
+@dataclass(slots=True)
 class ComposeConfig:
     """Configuration for generating compose files."""
 
@@ -725,7 +997,7 @@ class ComposeConfig:
 def generate_compose_file(config: ComposeConfig) -> Dict[str, Any]:
     """Generate docker-compose.yml for the environment."""
     # For git worktrees, we need to mount the worktree git metadata directory as well
-    safe_branch = config.repo_spec.branch.replace("/", "-")
+    safe_branch = config.repo_spec.safe_branch
     worktree_git_dir = config.repo_dir / "worktrees" / f"worktree-{safe_branch}"
 
     # Start with base service
@@ -741,7 +1013,7 @@ def generate_compose_file(config: ComposeConfig) -> Dict[str, Any]:
         ],
         "environment": {
             "REPO_NAME": config.repo_spec.repo,
-            "BRANCH_NAME": config.repo_spec.branch.replace("/", "-"),
+            "BRANCH_NAME": safe_branch,
         },
         "labels": {"wtd.managed": "true"},
         "stdin_open": True,
@@ -814,9 +1086,9 @@ def generate_compose_file(config: ComposeConfig) -> Dict[str, Any]:
     if config.build_dir is not None:
         config.build_dir.mkdir(parents=True, exist_ok=True)
 
+    # JSON is valid YAML, and json.dumps is far cheaper than PyYAML's emitter
     compose_path = compose_dir / "docker-compose.yml"
-    with open(compose_path, "w", encoding="utf-8") as f:
-        yaml.dump(compose_config, f, default_flow_style=False)
+    write_if_changed(compose_path, json.dumps(compose_config, indent=2))
 
     return compose_config
 
@@ -824,70 +1096,65 @@ def generate_compose_file(config: ComposeConfig) -> Dict[str, Any]:
 def generate_bake_file(
     extensions: List[Extension], base_image: str, platforms: List[str], build_dir: Path
 ) -> str:
-    """Generate docker-bake.hcl file for Buildx."""
-    # Create targets for each extension layer
-    targets = []
-
-    # Convert platforms list to proper HCL array syntax
-    platforms_hcl = "[" + ", ".join(f'"{platform}"' for platform in platforms) + "]"
-
-    current_image = base_image
-    for ext in extensions:
-        if not ext.dockerfile_content.strip():
-            continue
-
-        target_name = f"ext-{ext.name}"
-        target = f"""
-target "{target_name}" {{
-    context = "."
-    dockerfile = "Dockerfile.{ext.name}"
-    tags = ["wtd/{ext.name}:{ext.hash}"]
-    platforms = {platforms_hcl}
-    cache-from = ["type=local,src=.buildx-cache"]
-    cache-to = ["type=local,dest=.buildx-cache,mode=max"]
-}}"""
-        targets.append(target)
+    """Generate docker-bake.hcl file for Buildx, plus the Dockerfile for each extension layer."""
+    _, layer_dockerfiles, bake_content = _render_build_context(extensions, base_image, platforms)
 
-        # Ensure build directory exists
-        build_dir.mkdir(parents=True, exist_ok=True)
-
-        # Write individual Dockerfile for this extension
-        ext_dockerfile = f"FROM {current_image}\n{ext.dockerfile_content}"
-        dockerfile_path = build_dir / f"Dockerfile.{ext.name}"
-        dockerfile_path.write_text(ext_dockerfile, encoding="utf-8")
+    # Ensure build directory exists
+    build_dir.mkdir(parents=True, exist_ok=True)
 
-        current_image = f"wtd/{ext.name}:{ext.hash}"
+    for file_name, content in layer_dockerfiles.items():
+        write_if_changed(build_dir / file_name, content)
+    write_if_changed(build_dir / "docker-bake.hcl", bake_content)
 
-    # Final target combining all extensions
-    final_target = f"""
-target "final" {{
-    context = "."
-    dockerfile = "Dockerfile"
-    tags = ["wtd/final:{"-".join(ext.hash for ext in extensions)}"]
-    platforms = {platforms_hcl}
-    cache-from = ["type=local,src=.buildx-cache"]
-    cache-to = ["type=local,dest=.buildx-cache,mode=max"]
-}}"""
-    targets.append(final_target)
+    return bake_content
 
-    bake_content = "\n".join(targets)
 
-    # Write bake file
-    bake_path = build_dir / "docker-bake.hcl"
-    bake_path.write_text(bake_content, encoding="utf-8")
+def _docker_state(container_name: str, image_name: str) -> Tuple[Optional[str], bool]:
+    """Probe a container and an image with one `docker inspect` call.
 
-    return bake_content
+    Returns (container status or None if it does not exist, whether the image exists).
+    """
+    # docker inspect prints every object it finds and exits non-zero if any are missing;
+    # json.loads takes the raw bytes, so the output is never decoded as a whole
+    result = subprocess.run(
+        ["docker", "inspect", "--format", "{{json .}}", container_name, image_name],
+        capture_output=True,
+        check=False,
+    )
+    container_status = None
+    image_exists = False
+    for line in result.stdout.splitlines():
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        # An untyped inspect may also match a volume or network of the same name, so each
+        # object is identified by a key only containers or images carry
+        if isinstance(obj.get("State"), dict):
+            container_status = obj["State"].get("Status")
+        elif "RepoTags" in obj:
+            image_exists = True
+    return container_status, image_exists
 
 
 def should_rebuild_image(
     image_name: str,
     extensions: List[Extension],  # pylint: disable=unused-argument
+    state: Optional[Tuple[Optional[str], bool]] = None,
 ) -> bool:
-    """Check if image needs rebuilding based on extension hashes."""
+    """Check if image needs rebuilding based on extension hashes.
+
+    state is a result of _docker_state; when omitted the image is probed on its own.
+    """
+    if state is not None:
+        return not state[1]
     try:
         # Check if image exists
+        # Only the exit status matters, so ask for just the id rather than the full JSON document
         result = subprocess.run(
-            ["docker", "image", "inspect", image_name], capture_output=True, text=True, check=False
+            ["docker", "image", "inspect", "--format", "{{.Id}}", image_name],
+            capture_output=True,
+            check=False,
         )
 
         if result.returncode != 0:
@@ -922,35 +1189,59 @@ def build_image_with_bake(
         return False
 
 
-def is_container_usable(repo_spec: RepoSpec, work_dir: Path) -> bool:
-    """Check if the existing container is usable and accessible."""
+def compose_env(repo_spec: RepoSpec, compose_dir: Path) -> Dict[str, str]:
+    """Environment for docker compose calls on the environment whose compose file is in compose_dir.
+
+    COMPOSE_FILE names the file explicitly, so compose needs neither a chdir nor its own search.
+    """
+    env = os.environ.copy()
+    env["COMPOSE_PROJECT_NAME"] = repo_spec.compose_project_name
+    env["COMPOSE_FILE"] = str(compose_dir / "docker-compose.yml")
+    return env
+
+
+def is_container_usable(
+    repo_spec: RepoSpec,
+    work_dir: Path,  # pylint: disable=unused-argument
+    state: Optional[Tuple[Optional[str], bool]] = None,
+) -> bool:
+    """Check if the existing container is usable and accessible.
+
+    state is a result of _docker_state; when omitted the container is probed on its own.
+    """
     container_name = repo_spec.compose_project_name
 
     try:
         # Check if container exists and is running
-        result = subprocess.run(
-            ["docker", "inspect", "--format", "{{.State.Status}}", container_name],
-            capture_output=True,
-            text=True,
-            check=False,
-        )
+        if state is not None:
+            status = state[0]
+            if status is None:
+                return False  # Container doesn't exist
+            running = status == "running"
+        else:
+            result = subprocess.run(
+                ["docker", "inspect", "--format", "{{.State.Status}}", container_name],
+                capture_output=True,
+                check=False,
+            )
 
-        if result.returncode != 0:
-            return False  # Container doesn't exist
+            if result.returncode != 0:
+                return False  # Container doesn't exist
 
-        status = result.stdout.strip()
-        if status != "running":
-            logging.info(f"Container {container_name} exists but is not running (status: {status})")
+            # Compare the raw bytes; the status is only decoded if it ends up in the log
+            status = result.stdout.strip()
+            running = status == b"running"
+        if not running:
+            logging.info(
+                f"Container {container_name} exists but is not running "
+                f"(status: {os.fsdecode(status)})"
+            )
             return False
 
-        # Try to execute a simple command to test accessibility
-        env = os.environ.copy()
-        env["COMPOSE_PROJECT_NAME"] = repo_spec.compose_project_name
-
-        test_cmd = ["docker", "compose", "exec", "-T", "dev", "echo", "test"]
-        test_result = subprocess.run(
-            test_cmd, cwd=work_dir, env=env, capture_output=True, check=False, timeout=5
-        )
+        # Try to execute a simple command to test accessibility; plain docker exec on the known
+        # container name skips loading and resolving the compose project
+        test_cmd = ["docker", "exec", container_name, "true"]
+        test_result = subprocess.run(test_cmd, capture_output=True, check=False, timeout=5)
 
         if test_result.returncode == 0:
             logging.info(f"Reusing existing container: {container_name}")
@@ -963,19 +1254,25 @@ def is_container_usable(repo_spec: RepoSpec, work_dir: Path) -> bool:
         return False
 
 
-def cleanup_stale_container(repo_spec: RepoSpec) -> None:
-    """Clean up stale containers that are not usable."""
+def cleanup_stale_container(
+    repo_spec: RepoSpec, state: Optional[Tuple[Optional[str], bool]] = None
+) -> None:
+    """Clean up stale containers that are not usable.
+
+    state is a result of _docker_state; when omitted the container is probed on its own.
+    """
     container_name = repo_spec.compose_project_name
     try:
         # Check if container exists
-        result = subprocess.run(
-            ["docker", "inspect", container_name],
-            capture_output=True,
-            text=True,
-            check=False,
-        )
+        if state is not None:
+            exists = state[0] is not None
+        else:
+            result = subprocess.run(
+                ["docker", "inspect", container_name], capture_output=True, check=False
+            )
+            exists = result.returncode == 0
 
-        if result.returncode == 0:
+        if exists:
             logging.info(f"Removing stale container: {container_name}")
             # Stop and remove the container
             subprocess.run(["docker", "stop", container_name], check=False, capture_output=True)
@@ -985,28 +1282,32 @@ def cleanup_stale_container(repo_spec: RepoSpec) -> None:
 
 
 def run_compose_service(
-    compose_dir: Path, repo_spec: RepoSpec, command: Optional[List[str]] = None
+    compose_dir: Path,
+    repo_spec: RepoSpec,
+    command: Optional[List[str]] = None,
+    state: Optional[Tuple[Optional[str], bool]] = None,
 ) -> int:
-    """Run Docker Compose service and optionally execute command."""
-    env = os.environ.copy()
-    env["COMPOSE_PROJECT_NAME"] = repo_spec.compose_project_name
+    """Run Docker Compose service and optionally execute command.
+
+    state is a result of _docker_state, reused instead of probing the container again.
+    """
+    env = compose_env(repo_spec, compose_dir)
     env["USER_ID"] = str(os.getuid())
     env["GROUP_ID"] = str(os.getgid())
 
     try:
         # Check if we can reuse existing container
-        # Use compose_dir for container accessibility test since that's where compose file is
-        container_is_usable = is_container_usable(repo_spec, compose_dir)
+        container_is_usable = is_container_usable(repo_spec, compose_dir, state)
 
         if not container_is_usable:
             # Clean up stale container if it exists but is not usable
-            cleanup_stale_container(repo_spec)
+            cleanup_stale_container(repo_spec, state)
 
             # Start the service
-            subprocess.run(["docker", "compose", "up", "-d"], cwd=compose_dir, env=env, check=True)
+            subprocess.run(["docker", "compose", "up", "-d"], env=env, check=True)
 
             # Fix git worktree configuration in the container
-            safe_branch = repo_spec.branch.replace("/", "-")
+            safe_branch = repo_spec.safe_branch
             fix_git_cmd = [
                 "docker",
                 "compose",
@@ -1017,7 +1318,7 @@ def run_compose_service(
                 "-c",
                 f"echo 'gitdir: /workspace/{repo_spec.repo}.git/worktrees/worktree-{safe_branch}' > /workspace/{repo_spec.repo}/.git",
             ]
-            subprocess.run(fix_git_cmd, cwd=compose_dir, env=env, check=False)
+            subprocess.run(fix_git_cmd, env=env, check=False)
 
         if command:
             # Execute command in running container
@@ -1033,10 +1334,10 @@ def run_compose_service(
                 # Simple command
                 exec_cmd = ["docker", "compose", "exec", "dev"] + command
 
-            return subprocess.run(exec_cmd, cwd=compose_dir, env=env, check=False).returncode
+            return subprocess.run(exec_cmd, env=env, check=False).returncode
         # Interactive shell
         exec_cmd = ["docker", "compose", "exec", "dev", "bash"]
-        return subprocess.run(exec_cmd, cwd=compose_dir, env=env, check=False).returncode
+        return subprocess.run(exec_cmd, env=env, check=False).returncode
 
     except subprocess.CalledProcessError as e:
         logging.error(f"Failed to run compose service: {e}")
@@ -1078,11 +1379,10 @@ def destroy_environment(repo_spec: RepoSpec) -> bool:
         logging.warning(f"Environment not found: {repo_spec}")
         return False
 
-    env = os.environ.copy()
-    env["COMPOSE_PROJECT_NAME"] = repo_spec.compose_project_name
+    env = compose_env(repo_spec, build_dir)
 
     try:
-        subprocess.run(["docker", "compose", "down", "-v"], cwd=build_dir, env=env, check=True)
+        subprocess.run(["docker", "compose", "down", "-v"], env=env, check=True)
         logging.info(f"Destroyed environment: {repo_spec}")
         return True
     except subprocess.CalledProcessError as e:
@@ -1090,7 +1390,21 @@ def destroy_environment(repo_spec: RepoSpec) -> bool:
         return False
 
 
-@dataclass
+def compute_image_hash(extensions: List[Extension]) -> str:
+    """12 character image tag derived from the (cached) hashes of the given extensions."""
+    import hashlib  # Deferred like in Extension.hash
+
+    # Extension hashes are ASCII hex, fed in one at a time (NUL separated) with no joined copy;
+    # a 6 byte blake2b digest is exactly the 12 hex characters kept, so nothing is truncated
+    digest = hashlib.blake2b(digest_size=6)
+    for i, ext in enumerate(extensions):
+        if i:
+            digest.update(b"\0")
+        digest.update(ext.hash.encode("ascii"))
+    return digest.hexdigest()
+
+
+@dataclass(slots=True)
 class LaunchConfig:
     """Configuration for launching environments."""
 
@@ -1125,16 +1439,15 @@ def launch_environment(config: LaunchConfig) -> int:
         print(f"Auto-detected extensions: {', '.join(auto_detected)}")
 
     # Merge extensions: manual config + repo config + auto-detected
-    # Remove duplicates while preserving order
-    all_extensions = []
-    for ext in list(config.extensions) + repo_config.extensions + auto_detected:
-        if ext not in all_extensions:
-            all_extensions.append(ext)
-
-    if config.no_gui and "x11" in all_extensions:
-        all_extensions.remove("x11")
-    if config.no_gpu and "nvidia" in all_extensions:
-        all_extensions.remove("nvidia")
+    # Remove duplicates while preserving order, dropping extensions disabled by flags
+    disabled = {"x11"} if config.no_gui else set()
+    if config.no_gpu:
+        disabled.add("nvidia")
+    all_extensions = [
+        ext
+        for ext in dict.fromkeys(chain(config.extensions, repo_config.extensions, auto_detected))
+        if ext not in disabled
+    ]
 
     # Add required base extensions
     if "base" not in all_extensions:
@@ -1156,15 +1469,20 @@ def launch_environment(config: LaunchConfig) -> int:
             print(f"✗ Extension not found: {ext_name}")
 
     # Generate combined hash for image name
-    combined_hash = hashlib.sha256(
-        "".join(ext.hash for ext in loaded_extensions).encode()
-    ).hexdigest()[:12]
+    combined_hash = compute_image_hash(loaded_extensions)
 
     image_name = f"wtd/{config.repo_spec.repo}:{combined_hash}"
     base_image = repo_config.base_image
 
+    # One docker call covers the image check here and the container checks in run_compose_service
+    docker_state = _docker_state(config.repo_spec.compose_project_name, image_name)
+
     # Check if rebuild needed: always rebuild if --rebuild or --nocache is set
-    if config.rebuild or config.nocache or should_rebuild_image(image_name, loaded_extensions):
+    if (
+        config.rebuild
+        or config.nocache
+        or should_rebuild_image(image_name, loaded_extensions, docker_state)
+    ):
         # Ensure Buildx builder
         if not ensure_buildx_builder(config.builder_name):
             return 1
@@ -1173,8 +1491,7 @@ def launch_environment(config: LaunchConfig) -> int:
         build_dir = get_build_cache_dir(config.repo_spec)
 
         # Generate build files in build cache directory
-        generate_dockerfile(loaded_extensions, base_image, build_dir)
-        generate_bake_file(loaded_extensions, base_image, platforms, build_dir)
+        emit_build_context(loaded_extensions, base_image, platforms, build_dir)
 
         # Build image
         if not build_image_with_bake(build_dir, config.builder_name, nocache=config.nocache):
@@ -1183,7 +1500,8 @@ def launch_environment(config: LaunchConfig) -> int:
         logging.info(f"Built image: {image_name}")
 
         # Always remove any existing container if rebuilding (for nocache or rebuild)
-        cleanup_stale_container(config.repo_spec)
+        cleanup_stale_container(config.repo_spec, docker_state)
+        docker_state = (None, True)
 
     # Get build cache directory for compose file
     build_dir = get_build_cache_dir(config.repo_spec)
@@ -1201,7 +1519,7 @@ def launch_environment(config: LaunchConfig) -> int:
     generate_compose_file(compose_config)
 
     # Run environment using build directory for compose file
-    return run_compose_service(build_dir, config.repo_spec, config.command)
+    return run_compose_service(build_dir, config.repo_spec, config.command, docker_state)
 
 
 def cmd_launch(args) -> int:
@@ -1229,9 +1547,9 @@ def cmd_list(args) -> int:  # pylint: disable=unused-argument
         print("No active environments found.")
         return 0
 
-    print("Active environments:")
-    for container in containers:
-        print(f"  {container['name']}: {container['status']}")
+    # One write for the whole listing rather than one per line
+    lines = [f"  {container['name']}: {container['status']}" for container in containers]
+    print("\n".join(["Active environments:", *lines]))
     return 0
 
 
@@ -1255,6 +1573,32 @@ def cmd_prune(args) -> int:
         return 1
 
 
+def _list_images(filter_arg: str) -> Dict[str, List[str]]:
+    """Map image id -> repository:tag names for images matching a `docker images` filter.
+
+    One listing returns ids and tags together, instead of a `docker inspect` per image.
+    """
+    result = subprocess.run(
+        [
+            "docker",
+            "images",
+            "--filter",
+            filter_arg,
+            "--format",
+            "{{.ID}}\t{{.Repository}}:{{.Tag}}",
+        ],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    images: Dict[str, List[str]] = {}
+    for line in result.stdout.splitlines():
+        image_id, _, tag = line.partition("\t")
+        if image_id:
+            images.setdefault(image_id, []).append(tag)
+    return images
+
+
 def prune_repo_environment(repo_spec: RepoSpec) -> int:
     """Prune containers, images, and worktree for a specific repo spec."""
     try:
@@ -1266,66 +1610,45 @@ def prune_repo_environment(repo_spec: RepoSpec) -> int:
         subprocess.run(["docker", "stop", container_name], check=False, capture_output=True)
         subprocess.run(["docker", "rm", container_name], check=False, capture_output=True)
 
-        # Remove associated images (wtd images for this repo)
-        removed_images = []
-        try:
-            result = subprocess.run(
-                ["docker", "images", "--filter", f"reference=wtd/{repo_spec.repo}*", "-q"],
-                capture_output=True,
-                text=True,
-                check=False,
-            )
-            if result.stdout.strip():
-                image_ids = result.stdout.strip().split("\n")
-                # Get image names before removing
-                for image_id in image_ids:
-                    name_result = subprocess.run(
-                        ["docker", "inspect", "--format", "{{.RepoTags}}", image_id],
-                        capture_output=True,
-                        text=True,
-                        check=False,
-                    )
-                    if name_result.stdout.strip():
-                        removed_images.append(name_result.stdout.strip())
-
-                subprocess.run(
-                    ["docker", "rmi", "-f"] + image_ids, check=False, capture_output=True
-                )
-                for image in removed_images:
-                    print(f"Removed image: {image}")
-        except subprocess.CalledProcessError:
-            pass
-
-        # Clean up compose volumes first from build directory
+        # Compose volumes go first so nothing still references the images removed next
         build_dir = get_build_cache_dir(repo_spec)
         if build_dir.exists():
-            env = os.environ.copy()
-            env["COMPOSE_PROJECT_NAME"] = repo_spec.compose_project_name
             subprocess.run(
                 ["docker", "compose", "down", "-v"],
-                cwd=build_dir,
-                env=env,
+                env=compose_env(repo_spec, build_dir),
                 check=False,
                 capture_output=True,
             )
 
+        # Remove associated images (wtd images for this repo)
+        try:
+            images = _list_images(f"reference=wtd/{repo_spec.repo}*")
+            if images:
+                # Image names are listed before removing
+                removed_images = [" ".join(tags) for tags in images.values()]
+
+                subprocess.run(["docker", "rmi", "-f", *images], check=False, capture_output=True)
+                for image in removed_images:
+                    print(f"Removed image: {image}")
+        except subprocess.CalledProcessError:
+            pass
+
         # Remove worktree directory
         if worktree_dir.exists():
             print(f"Removing worktree: {worktree_dir}")
-            subprocess.run(["rm", "-rf", str(worktree_dir)], check=False)
+            shutil.rmtree(worktree_dir, ignore_errors=True)
 
         # Remove build cache directory
         if build_dir.exists():
             print(f"Removing build cache: {build_dir}")
-            subprocess.run(["rm", "-rf", str(build_dir)], check=False)
+            shutil.rmtree(build_dir, ignore_errors=True)
 
-        # Clean up git worktree registration if repo exists
+        # Clean up git worktree registration if repo exists; with the directory gone,
+        # prune drops its admin entry (and any other stale one) without a per-branch lookup
         repo_dir = get_repo_dir(repo_spec)
         if repo_dir.exists():
-            safe_branch = repo_spec.branch.replace("/", "-")
-            worktree_name = f"worktree-{safe_branch}"
             subprocess.run(
-                ["git", "-C", str(repo_dir), "worktree", "remove", worktree_name],
+                ["git", "-C", str(repo_dir), "worktree", "prune"],
                 check=False,
                 capture_output=True,
             )
@@ -1346,61 +1669,47 @@ def prune_all() -> int:
         # Get all wtd-related containers and remove them
         try:
             # Only prune containers with the wtd.managed label
+            # One listing returns ids and names together, instead of a docker inspect per id
             result = subprocess.run(
-                ["docker", "ps", "-aq", "--filter", "label=wtd.managed=true"],
+                [
+                    "docker",
+                    "ps",
+                    "-a",
+                    "--filter",
+                    "label=wtd.managed=true",
+                    "--format",
+                    "{{.ID}}\t{{.Names}}",
+                ],
                 capture_output=True,
                 text=True,
                 check=False,
             )
-            if result.stdout.strip():
-                container_ids = result.stdout.strip().split("\n")
-                for container_id in container_ids:
-                    inspect_result = subprocess.run(
-                        ["docker", "inspect", "--format", "{{.Name}}", container_id],
-                        capture_output=True,
-                        text=True,
-                        check=False,
-                    )
-                    if inspect_result.stdout.strip():
-                        container_name = inspect_result.stdout.strip().lstrip("/")
-                        print(f"Removing container: {container_name}")
-                        subprocess.run(
-                            ["docker", "stop", container_id], check=False, capture_output=True
-                        )
-                        subprocess.run(
-                            ["docker", "rm", "-f", container_id],
-                            check=False,
-                            capture_output=True,
-                        )
-                        removed_containers.append(container_name)
+            container_ids = []
+            for line in result.stdout.splitlines():
+                container_id, _, container_name = line.partition("\t")
+                if container_id and container_name:
+                    print(f"Removing container: {container_name}")
+                    container_ids.append(container_id)
+                    removed_containers.append(container_name)
+            # docker stop and rm take any number of ids, so two calls cover every container
+            if container_ids:
+                subprocess.run(["docker", "stop", *container_ids], check=False, capture_output=True)
+                subprocess.run(
+                    ["docker", "rm", "-f", *container_ids], check=False, capture_output=True
+                )
         except subprocess.CalledProcessError:
             pass
 
         # Get wtd-managed images and remove them
         try:
             # Only prune images with the wtd.managed label
-            result = subprocess.run(
-                ["docker", "images", "-q", "--filter", "label=wtd.managed=true"],
-                capture_output=True,
-                text=True,
-                check=False,
-            )
-            if result.stdout.strip():
-                image_ids = result.stdout.strip().split("\n")
-                for image_id in image_ids:
-                    name_result = subprocess.run(
-                        ["docker", "inspect", "--format", "{{.RepoTags}}", image_id],
-                        capture_output=True,
-                        text=True,
-                        check=False,
-                    )
-                    if name_result.stdout.strip():
-                        image_tags = name_result.stdout.strip()
-                        print(f"Removing image: {image_tags}")
-                        removed_images.append(image_tags)
-                        subprocess.run(
-                            ["docker", "rmi", "-f", image_id], check=False, capture_output=True
-                        )
+            images = _list_images("label=wtd.managed=true")
+            for tags in images.values():
+                image_tags = " ".join(tags)
+                print(f"Removing image: {image_tags}")
+                removed_images.append(image_tags)
+            if images:
+                subprocess.run(["docker", "rmi", "-f", *images], check=False, capture_output=True)
         except subprocess.CalledProcessError:
             pass
 
@@ -1410,7 +1719,8 @@ def prune_all() -> int:
         for folder in [cache_dir, workspaces_dir]:
             if os.path.exists(folder):
                 print(f"Removing directory: {folder}")
-                subprocess.run(["rm", "-rf", folder], check=False)
+                shutil.rmtree(folder, ignore_errors=True)
+        clear_cache_dir_memo()
 
         # Print summary
         if removed_containers or removed_images:
@@ -1464,34 +1774,30 @@ def cmd_doctor(args) -> int:  # pylint: disable=unused-argument
         ("Git", lambda: subprocess.run(["git", "--version"], capture_output=True, check=True)),
     ]
 
-    all_good = True
-    for name, check_func in checks:
+    def run_check(check_func) -> bool:
         try:
             check_func()
-            print(f"✓ {name}")
+            return True
         except (subprocess.CalledProcessError, FileNotFoundError):
-            print(f"✗ {name}")
-            all_good = False
+            return False
 
-    return 0 if all_good else 1
+    # Each check just waits on a subprocess, so run them side by side and report in order
+    with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+        results = list(executor.map(run_check, [check_func for _, check_func in checks]))
 
+    for (name, _), ok in zip(checks, results):
+        print(f"✓ {name}" if ok else f"✗ {name}")
 
-def main(argv: Optional[List[str]] = None) -> int:
-    """Main entry point.
+    return 0 if all(results) else 1
 
-    Accepts an optional argv list for programmatic invocation (used by the
-    lightweight `wt` wrapper which prepends --no-docker). When None, falls
-    back to sys.argv[1:].
-    """
-    arg_list = argv if argv is not None else sys.argv[1:]
-    parser = argparse.ArgumentParser(
-        prog="wtd",
-        usage="wtd [OPTIONS] [-e ext1 ext2 ...] <owner>/<repo>[@<branch>][#<subfolder>] [command...]",
-        description="""A development environment launcher using Docker, Git worktrees, and Buildx/Bake.
 
-Clones and manages repositories in isolated git worktrees, builds cached container environments using Docker Buildx + Bake, and launches fully configured shells or commands inside each branch-specific container workspace.""",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""Examples:
+HELP_USAGE = "wtd [OPTIONS] [-e ext1 ext2 ...] <owner>/<repo>[@<branch>][#<subfolder>] [command...]"
+
+HELP_DESCRIPTION = """A development environment launcher using Docker, Git worktrees, and Buildx/Bake.
+
+Clones and manages repositories in isolated git worktrees, builds cached container environments using Docker Buildx + Bake, and launches fully configured shells or commands inside each branch-specific container workspace."""
+
+HELP_EPILOG = """Examples:
   wtd blooop/test_wtd@main
   wtd -e uv blooop/test_wtd@feature/foo
   wtd -e git uv blooop/test_wtd@main#src
@@ -1518,13 +1824,32 @@ Environment:
   WTD_CACHE_DIR            Set custom cache directory (default: ~/.wtd/)
   WTD_BASE_IMAGE           Override base image used for environments
   WTD_CACHE_REGISTRY       Push/pull extension build cache to a registry
+  WTD_BUILDX_CACHE         Local buildx layer cache dir (default: .buildx-cache in build dir)
+  WTD_CLONE_FILTER         Partial clone filter for new repos (default: blob:none, empty for full)
 
 Notes:
   - Worktrees are stored under ~/.wtd/workspaces/<owner>/<repo>/worktree-<branch>
   - Extensions can be configured via .wtd.yml in the repo
   - Extension images are hashed and reused across repos/branches automatically
   - Supports Docker socket sharing (DOOD) and Docker-in-Docker (DinD) setups
-""",
+"""
+
+# Flags that dispatch straight to a command when given on their own, before the parser is built
+_FAST_COMMANDS = {
+    "--list": lambda: cmd_list(argparse.Namespace()),
+    "--ext-list": lambda: cmd_ext(argparse.Namespace(ext_action="list", ext_name=None)),
+    "--doctor": lambda: cmd_doctor(argparse.Namespace()),
+}
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    """Build the wtd argument parser."""
+    parser = argparse.ArgumentParser(
+        prog="wtd",
+        usage=HELP_USAGE,
+        description=HELP_DESCRIPTION,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=HELP_EPILOG,
     )
 
     # Add extensions as a global option that comes before repo_spec
@@ -1596,11 +1921,32 @@ Notes:
         action="store_true",
         help="Skip all Docker build/launch logic; only manage git worktree and run command locally. Note: Docker-dependent features, such as containerized environments and dependencies, will not be available with --no-docker.",
     )
+    return parser
+
 
+def main(argv: Optional[List[str]] = None) -> int:
+    """Main entry point.
+
+    Accepts an optional argv list for programmatic invocation (used by the
+    lightweight `wt` wrapper which prepends --no-docker). When None, falls
+    back to sys.argv[1:].
+    """
+    arg_list = argv if argv is not None else sys.argv[1:]
+    # Each invocation resolves the cache directory afresh; main may run repeatedly in-process
+    clear_cache_dir_memo()
     # Handle --install flag specially (must look in provided arg list)
     if "--install" in arg_list:
         return cmd_install(argparse.Namespace())
 
+    # A lone informational flag needs none of the parser's options; --no-docker (prepended by
+    # the wt wrapper) does not change what these commands do
+    flags = [arg for arg in arg_list if arg != "--no-docker"]
+    if len(flags) == 1 and flags[0] in _FAST_COMMANDS:
+        logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+        return _FAST_COMMANDS[flags[0]]()
+
+    parser = _build_parser()
+
     # Parse known args first to avoid conflicts with container command flags
     parsed_args, unknown_args = parser.parse_known_args(arg_list)
 
@@ -1653,31 +1999,32 @@ Notes:
             exec_dir.mkdir(parents=True, exist_ok=True)
 
         # Run command locally or open shell
-        if parsed_args.command:
-            cmd = parsed_args.command
-            if cmd and cmd[0] == "--":  # allow wt style delimiter
-                cmd = cmd[1:]
+        cmd = parsed_args.command
+        if cmd and cmd[0] == "--":  # allow wt style delimiter
+            cmd = cmd[1:]
+        if cmd:
             logging.info("Running local command in worktree: %s", " ".join(cmd))
-            return subprocess.run(cmd, cwd=exec_dir, check=False).returncode
-        # Interactive shell
-        shell = os.environ.get("SHELL", "bash")
-        logging.info("Opening local shell in %s", exec_dir)
-        return subprocess.run([shell], cwd=exec_dir, check=False).returncode
-
-    # Convert to launch command format
-    launch_args = argparse.Namespace()
-    launch_args.repo_spec = parsed_args.repo_spec
-    launch_args.command = parsed_args.command
-    # Flatten extensions list since they come from action="append"
-    launch_args.extensions = parsed_args.extensions or []
-    launch_args.rebuild = parsed_args.rebuild
-    launch_args.nocache = parsed_args.nocache
-    launch_args.no_gui = parsed_args.no_gui
-    launch_args.no_gpu = parsed_args.no_gpu
-    launch_args.builder = parsed_args.builder
-    launch_args.platforms = parsed_args.platforms
-
-    return cmd_launch(launch_args)
+        else:
+            # Interactive shell
+            cmd = [os.environ.get("SHELL", "bash")]
+            logging.info("Opening local shell in %s", exec_dir)
+        # Nothing runs after the command, so replace this process with it instead of keeping
+        # Python resident to wait; the command's exit status becomes wtd's directly
+        sys.stdout.flush()
+        sys.stderr.flush()
+        original_cwd = os.getcwd()
+        os.chdir(exec_dir)
+        try:
+            os.execvp(cmd[0], cmd)
+        except OSError as e:
+            # Only reached when the command could not be started; 127 matches the shell. main
+            # may be called in-process, so the caller gets its working directory back
+            os.chdir(original_cwd)
+            logging.error(f"Failed to run {cmd[0]}: {e}")
+            return 127
+
+    # parsed_args already carries every field cmd_launch reads, so it goes straight through
+    return cmd_launch(parsed_args)
 
 
 if __name__ == "__main__":